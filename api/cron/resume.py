@@ -0,0 +1,12 @@
+from http.server import BaseHTTPRequestHandler
+
+from utils.worker import trigger_job
+
+
+class handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        # Only continues a job that ran out of time (or failed); never starts a new one
+        trigger_job(self, resume_only=True)
+
+        return
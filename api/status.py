@@ -0,0 +1,27 @@
+import json
+import urllib.parse
+from http.server import BaseHTTPRequestHandler
+
+from utils.utils import get_job_status
+
+
+class handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        job_id = query.get('job_id', [None])[0]
+
+        status = get_job_status(job_id)
+        if status is None:
+            code, payload = 404, {'error': f"Unknown job: {job_id}"}
+        else:
+            code, payload = 200, status
+
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        return
@@ -1,31 +1,155 @@
 # agent.py
-import ast
-import re
+import hashlib
+import inspect
+import json
+from concurrent.futures import ThreadPoolExecutor
 
 from loguru import logger
 import os
-import openai
 
-from tools.search import search
-from utils.llm import invoke_local_llm, invoke_llm_, invoke_llm
+from utils.backends import get_backend
+from utils.chunker import count_tokens
 
 # Import the tools
 from tools import (
     get_lib,
-    open_webpage,
-    call_api,
-    execute_cli_command,
     get_user_input,
-    output_information,
-    read_file
+    TOOLS,
+    tool_schemas
 )
 
 logger.remove()
 logger.add("log/run.log", rotation="10 MB", retention="10 days", compression="zip")
 
+# LLM backend of the assistant, see utils.backends; e.g. 'local' for a local model
+ASSISTANT_BACKEND = os.getenv('ASSISTANT_BACKEND', 'openai')
+
+# Tokens of conversation sent per turn, and how many of the latest messages are never compacted
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', 16000))
+HISTORY_KEEP_RECENT = int(os.getenv('HISTORY_KEEP_RECENT', 6))
+# Old tool outputs are cut down to about this many tokens, or summarized by the LLM with HISTORY_SUMMARIZE=1
+TOOL_OUTPUT_COMPACT_TOKENS = int(os.getenv('TOOL_OUTPUT_COMPACT_TOKENS', 200))
+HISTORY_SUMMARIZE = os.getenv('HISTORY_SUMMARIZE') == '1'
+# Read-only tool calls of one reply run concurrently, on up to this many threads
+TOOL_MAX_WORKERS = int(os.getenv('TOOL_MAX_WORKERS', 4))
+
+TOOL_OUTPUT_SUMMARY_PROMPT = """
+This is the output of a tool an assistant used earlier in a conversation. Summarize it in a few sentences, keeping every fact (names, values, paths, errors) the assistant may still need.
+
+{content}"""
+
+class ConversationHistory:
+    """
+    The agent's messages, kept within a token budget.
+
+    Pinned messages (the system prompt) are always sent in full. Once the conversation outgrows
+    `budget`, the oldest tool outputs outside the `keep_recent` latest messages are truncated (or
+    summarized), then the oldest unpinned messages are dropped; a reply with tool calls is dropped
+    together with their results. A tool output identical to an earlier one replaces it, so repeated
+    results are sent once. Compaction rewrites the stored messages, so each one is compacted only once.
+    """
+
+    def __init__(self, budget=HISTORY_TOKEN_BUDGET, keep_recent=HISTORY_KEEP_RECENT,
+                 compact_tokens=TOOL_OUTPUT_COMPACT_TOKENS, summarize=None):
+        self.budget = budget
+        self.keep_recent = keep_recent
+        self.compact_tokens = compact_tokens
+        self.summarize = summarize
+        self.entries = []
+        self.dropped = 0
+
+    def append(self, message, pinned=False, tool=False):
+        calls = "".join(call['function']['name'] + call['function']['arguments'] for call in message.get('tool_calls', []))
+        entry = {'message': dict(message), 'pinned': pinned, 'tool': tool, 'compacted': False,
+                 'tokens': count_tokens((message.get('content') or "") + calls)}
+        if tool:
+            entry['digest'] = hashlib.sha1(message['content'].encode('utf-8')).hexdigest()
+            for old in self.entries:
+                if old.get('digest') == entry['digest'] and not old['compacted']:
+                    self._replace(old, "[Tool output repeated further below]")
+        self.entries.append(entry)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def total_tokens(self):
+        return sum(entry['tokens'] for entry in self.entries)
+
+    def _replace(self, entry, content):
+        entry['message']['content'] = content
+        entry['tokens'] = count_tokens(content)
+        entry['compacted'] = True
+
+    def _compact_tool_output(self, entry):
+        content = entry['message']['content']
+        if self.summarize is not None:
+            try:
+                self._replace(entry, f"[Summary of an earlier tool output]\n{self.summarize(content)}")
+                return
+            except Exception as e:
+                logger.error(f"Failed to summarize tool output, truncating it instead: {e}")
+        head = content[:self.compact_tokens * 4]
+        self._replace(entry, f"{head}\n[... {entry['tokens'] - count_tokens(head)} more tokens of this output truncated]")
+
+    def _unit(self, index):
+        """The entry at `index` and, for a reply with tool calls, the results of its calls."""
+        entry = self.entries[index]
+        ids = {call['id'] for call in entry['message'].get('tool_calls', [])}
+        return [entry] + [other for other in self.entries[index + 1:] if other['message'].get('tool_call_id') in ids]
+
+    def compact(self):
+        """Bring the history within the token budget."""
+        total = self.total_tokens()
+        if total <= self.budget:
+            return
+
+        old = self.entries[:max(0, len(self.entries) - self.keep_recent)]
+        for entry in old:
+            if entry['tool'] and not entry['pinned'] and not entry['compacted'] and entry['tokens'] > self.compact_tokens:
+                before = entry['tokens']
+                self._compact_tool_output(entry)
+                total -= before - entry['tokens']
+                if total <= self.budget:
+                    break
+
+        while total > self.budget:
+            recent = self.entries[max(0, len(self.entries) - self.keep_recent):]
+            unit = None
+            for index, entry in enumerate(self.entries):
+                # Tool results only go together with the reply that called them
+                if entry['pinned'] or 'tool_call_id' in entry['message']:
+                    continue
+                candidate = self._unit(index)
+                if not any(member is r for member in candidate for r in recent):
+                    unit = candidate
+                    break
+            if unit is None:
+                break
+            for member in unit:
+                self.entries.remove(member)
+                total -= member['tokens']
+            self.dropped += len(unit)
+        logger.info(f"Conversation history compacted to {total} tokens ({self.dropped} messages dropped so far)")
+
+    def messages(self):
+        """The messages to send for the next turn."""
+        self.compact()
+        pinned = [entry['message'] for entry in self.entries if entry['pinned']]
+        rest = [entry['message'] for entry in self.entries if not entry['pinned']]
+        notice = []
+        if self.dropped:
+            notice = [{"role": "system",
+                       "content": f"{self.dropped} earlier messages of this conversation were dropped to save space."}]
+        return pinned + notice + rest
+
+
 class Agent:
     def __init__(self):
-        self.conversation_history = []
+        summarize = None
+        if HISTORY_SUMMARIZE:
+            summarize = lambda content: get_backend(ASSISTANT_BACKEND).chat(
+                [{"role": "user", "content": TOOL_OUTPUT_SUMMARY_PROMPT.format(content=content)}], temperature=0)
+        self.conversation_history = ConversationHistory(summarize=summarize)
         self.system_prompt = """
 You are an AI assistant helping users manage a project called arXiv Sentinel.
 This project consists of a serverless function deployed on Vercel, which can regularly download papers from a specified topic on arXiv, summarize the papers using LLM, and generate a report for the user.
@@ -52,274 +176,156 @@ The high level process of deploying this project:
     Step04, Deploy function in the cloud
 
 Example 02:
-    Action: OpenWebpage(url='arxiv.org')
-    Action: OutputInformation(info='I already help you open the arXiv website, now you can find all topics')
-    Action: GetUserInput(prompt='Please provide me with the arXiv topic you like')
+    open_webpage(url='https://arxiv.org/')
+    output_information(info='I already help you open the arXiv website, now you can find all topics')
+    get_user_input(prompt='Please provide me with the arXiv topic you like')
 
 Example 03:
-    Action: ExecuteCLICommand(command='vercel env pull')
-    Action: ReadFile(command='.env.local')
-    Action: OutputInformation(info='Vercel env variables: {.env.local content}')
+    execute_cli_command(command='vercel env pull')
+    read_file(file_path='.env.local')
+    output_information(info='Vercel env variables: {.env.local content}')
 
 Note that this is not a fixed step, you need to understand it according to the task.
 
-You can take actions in the following format:
-
-Action: ActionName(param1='value1', param2='value2')
-
-Available Actions:
-- OpenWebpage(url='...')
-- CallAPI(url='...', params={...})
-- ExecuteCLICommand(command='...')
-- GetUserInput(prompt='...')
-- OutputInformation(info='...')
-- ReadFile(file_path='...')
-- Search(query='...', cse_id='...', api_key='...')
-- QUIT 
-
-Note, To ensure success: 
-    1. Respond only with actions, and do not include any additional text.
-    2. Respond only one action at a time
+You act by calling the tools you are given. Note, To ensure success: 
+    1. Call several tools in one reply when none of them needs the result of another; they run in the order you give them.
+    2. Wait for the result of a tool call before making calls that depend on it.
+    3. When the task is finished, reply with QUIT.
     
 """
         self.conversation_history.append({
             "role": "system",
             "content": self.system_prompt
-        })
+        }, pinned=True)
 
         self.conversation_history.append({
             "role": "system",
             "content": f"knowledge base: \n\n{get_lib()}"
-        })
+        }, tool=True)
 
         self.conversation_history.append({
             "role": "system",
             "content": "You can't execute actions directly. You need to first collect user needs and then perform tasks based on the needs."
-        })
+        }, pinned=True)
 
     def get_llm_response(self, prompt=""):
-        if prompt == "":
+        if prompt != "":
             # Add the user's input to the conversation
             self.conversation_history.append({
                 "role": "user",
                 "content": prompt
             })
 
-        # assistant_reply = invoke_local_llm(self.conversation_history)
-        assistant_reply = invoke_llm_(self.conversation_history)
+        reply = get_backend(ASSISTANT_BACKEND).chat_message(self.conversation_history.messages(),
+                                                            tools=tool_schemas(), temperature=0)
+        message = {"role": "assistant", "content": reply.content}
+        if reply.tool_calls:
+            message["tool_calls"] = [{
+                "id": call.id,
+                "type": "function",
+                "function": {"name": call.function.name, "arguments": call.function.arguments},
+            } for call in reply.tool_calls]
 
         # Update conversation history
-        self.conversation_history.append({
-            "role": "assistant",
-            "content": assistant_reply
-        })
+        self.conversation_history.append(message)
 
-        logger.info(f"LLM response: {assistant_reply}")
+        logger.info(f"LLM response: {message}")
 
-        return assistant_reply
+        return message
 
-    def parse_actions(self, assistant_reply):
+    def prepare_tool_call(self, call):
         """
-        Parses the assistant's reply to extract actions.
-        Assumes each action is on a new line starting with 'Action:'.
+        Look up the tool of `call`, check its arguments and ask the user to confirm it if the tool
+        requires that. Returns the tool and its arguments, or None and the message to answer the call with.
         """
-        actions = []
-        lines = assistant_reply.strip().split('\n')
-        for line in lines:
-            if line.startswith("Action:"):
-                logger.info(f"Action: {line}")
-                action_line = line[len("Action:"):].strip()
-                actions.append(action_line)
-                # print(f"{action_line}")
-        return actions
-
-    def execute_action(self, action_str) -> str:
-
-        # print(f"Execute action: {action_str}")
-        logger.info(f"Execute action: {action_str}")
-
-
-        err = ""
+        name = call['function']['name']
+        func = TOOLS.get(name)
+        if func is None:
+            return None, f"Unknown tool: {name}"
 
         try:
-            if action_str == "GetLib":
-                self.conversation_history.append({
-                    "role": "system",
-                    "content": get_lib()
-                })
-
-            elif action_str.startswith("OpenWebpage"):
-                # Extract URL
-                params = self.extract_params(action_str)
-                url = params.get('url')
-                if url:
-                    open_webpage(url)
-                else:
-                    err = "URL parameter missing in OpenWebpage action."
-
-            elif action_str.startswith("CallAPI"):
-                params = self.extract_params(action_str)
-                url = params.get('url')
-                api_params = params.get('params', {})
-                if url:
-                    response = call_api(url, params=api_params)
-                    print(f"API Response: {response}")
-
-                    self.conversation_history.append({
-                        "role": "user",
-                        "content": f"API response: \n\n{response}"
-                    })
-                else:
-                    err = "URL parameter missing in CallAPI action."
-
-            elif action_str.startswith("ExecuteCLICommand"):
-                params = self.extract_params(action_str)
-                command = params.get('command')
-                if command:
-                    execute_cli_command(command)
-                else:
-                    err = "Command parameter missing in ExecuteCLICommand action."
-
-            elif action_str.startswith("GetUserInput"):
-
-                params = self.extract_params(action_str)
-
-                prompt = params.get('prompt')
-                # print(prompt)
-
-                if prompt is None or prompt == '':
-                    err = "Prompt parameter missing in GetUserInput action."
-
-                user_input = get_user_input(prompt)
-                self.conversation_history.append({
-                    "role": "user",
-                    "content": user_input
-                })
-
-            elif action_str.startswith("OutputInformation"):
-                params = self.extract_params(action_str)
-                info = params.get('info')
-                if info:
-                    output_information(info)
-                else:
-                    err = "Info parameter missing in OutputInformation action."
-
-            elif action_str.startswith("ReadFile"):
-                params = self.extract_params(action_str)
-                file_path = params.get('file_path')
-                if file_path:
-                    content = read_file(file_path)
-
-                    self.conversation_history.append({
-                        "role": "user",
-                        "content": f"File content: \n\n{content}"
-                    })
-                else:
-                    err = "File path parameter missing in ReadFile action."
-
-            elif action_str.startswith("Search"):
-                params = self.extract_params(action_str)
-
-                query = params.get('query')
-                cse_id = params.get('cse_id')
-                api_key = params.get('api_key')
-
-                if query:
-                    content = search(query, cse_id, api_key)
-                    self.conversation_history.append({
-                        "role": "user",
-                        "content": f"Search result: \n\n{content}"
-                    })
-                else:
-                    err = "Query parameter missing in Search action."
-
-            else:
-                err = f"Unknown action: {action_str}"
-
+            args = json.loads(call['function']['arguments'] or "{}")
+            bound = inspect.signature(func).bind(**args)
+        except (ValueError, TypeError) as e:
+            return None, f"Invalid arguments for {name}: {e}"
+        bound.apply_defaults()
+
+        if func.confirm:
+            c = input(func.confirm.format(**bound.arguments))
+            # Anything but an explicit yes refuses, an empty answer included
+            if c.strip().lower() != "y":
+                return None, f"User refused to run {name}"
+        return func, bound.arguments
+
+    def run_tool(self, func, args) -> str:
+        logger.info(f"Execute tool: {func.__name__}({args})")
+        try:
+            result = func(**args)
         except Exception as e:
-            err = f"Error executing action '{action_str}': {e}"
-
-        if err!="":
+            err = f"Error executing tool '{func.__name__}': {e}"
             logger.error(err)
-        return err
+            return err
 
-    import re
-    import ast
+        if result is None:
+            return "Tool executed"
+        return result if isinstance(result, str) else json.dumps(result, default=str)
 
-    def extract_params(self, action_str):
+    def execute_tool_calls(self, tool_calls):
         """
-        Extracts parameters from an action string into a dictionary.
-        Handles values with special characters and nested structures.
+        Run the tool calls of one reply and return their outputs, in order. Calls run in the order
+        given, except that consecutive calls of read-only tools run concurrently.
         """
-        # Find the first '(' and the last ')'
-        start = action_str.find('(')
-        end = action_str.rfind(')')
-        params_str = action_str[start + 1:end].strip()
-
-        # Regex to match key-value pairs (supports values with '=' and other special chars)
-        param_pattern = re.compile(r"(\w+)\s*=\s*(.+?)(?=\s*,\s*\w+\s*=|\s*$)")
-        matches = param_pattern.findall(params_str)
+        outputs = [None] * len(tool_calls)
+        start = 0
+        while start < len(tool_calls):
+            end = start + 1
+            func = TOOLS.get(tool_calls[start]['function']['name'])
+            if func is not None and func.parallel:
+                while end < len(tool_calls) and getattr(TOOLS.get(tool_calls[end]['function']['name']), 'parallel', False):
+                    end += 1
+
+            # Confirmations go one by one on the console, before any of the group runs
+            runnable = []
+            for i in range(start, end):
+                func, args = self.prepare_tool_call(tool_calls[i])
+                if func is None:
+                    logger.error(args)
+                    outputs[i] = args
+                else:
+                    runnable.append((i, func, args))
 
-        params = {}
-        for key, value in matches:
-            try:
-                # Attempt to parse value as Python literal (e.g., string, dict, list)
-                params[key] = ast.literal_eval(value)
-            except (ValueError, SyntaxError):
-                # If it fails, keep it as a string
-                params[key] = value.strip("'\"")
-
-        return params
-
-    # def extract_params(self, action_str):
-    #     """
-    #     Extracts parameters from an action string into a dictionary.
-    #     """
-    #     import ast
-    #
-    #     # Find the first '(' and the last ')'
-    #     start = action_str.find('(')
-    #     end = action_str.rfind(')')
-    #     params_str = action_str[start+1:end]
-    #     params_str = params_str.strip()
-    #     # print(params_str)
-    #
-    #     params_str = params_str.split(',')
-    #
-    #     params = {}
-    #     for param in params_str:
-    #         param = param.strip()
-    #         key, value = param.split('=')
-    #         params[key] = value.replace("'","")
-    #
-    #     return params
+            if len(runnable) > 1:
+                with ThreadPoolExecutor(max_workers=min(len(runnable), TOOL_MAX_WORKERS)) as executor:
+                    futures = [(i, executor.submit(self.run_tool, func, args)) for i, func, args in runnable]
+                    for i, future in futures:
+                        outputs[i] = future.result()
+            else:
+                for i, func, args in runnable:
+                    outputs[i] = self.run_tool(func, args)
+            start = end
+        return outputs
 
     def run(self, prompt=""):
         print("Agent is running.\n")
         while True:
             print("\n====================================================\n")
-            assistant_reply = self.get_llm_response()
-            if "QUIT" in assistant_reply:
-                break
-
-            logger.info(f"Assistant:\n{assistant_reply}\n")
-
-            actions = self.parse_actions(assistant_reply)
-
-            for action in actions:
-
-                output = self.execute_action(action)
-
-                if output != "":
-                    self.conversation_history.append({
-                        "role": "user",
-                        "content": output
-                    })
-                else:
-                    self.conversation_history.append({
-                        "role": "user",
-                        "content": "Action Executed"
-                    })
+            message = self.get_llm_response(prompt)
+            prompt = ""
+
+            if not message.get("tool_calls"):
+                if "QUIT" in (message["content"] or ""):
+                    break
+                # A plain answer: show it and let the user reply
+                prompt = get_user_input(message["content"] or "")
+                continue
+
+            outputs = self.execute_tool_calls(message["tool_calls"])
+            for call, output in zip(message["tool_calls"], outputs):
+                self.conversation_history.append({
+                    "role": "tool",
+                    "tool_call_id": call["id"],
+                    "content": output
+                }, tool=True)
 
 if __name__ == "__main__":
     agent = Agent()
@@ -0,0 +1,85 @@
+"""
+Regenerate the sample PDFs of the benchmark corpus: python -m benchmarks.make_fixtures
+
+The PDFs are synthetic but shaped like papers: a title, numbered sections of varying length,
+a figure and a reference list. Output is deterministic, so re-running it doesn't churn the repo.
+"""
+import io
+import os
+import random
+import textwrap
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+WORDS = (
+    "model training data learning network attention layer token sequence benchmark evaluation "
+    "baseline accuracy loss gradient optimization agent policy reward environment language vision "
+    "representation embedding transformer retrieval graph inference latency throughput memory "
+    "dataset generalization robustness scaling parameter objective distribution sampling"
+).split()
+
+SECTIONS = ["Introduction", "Related Work", "Method", "Experiments", "Results", "Discussion", "Conclusion"]
+
+# (file name, title, words per section)
+PAPERS = [
+    ("short.pdf", "A Short Note on Efficient Attention", 150),
+    ("medium.pdf", "Scaling Retrieval for Language Agents", 600),
+    ("long.pdf", "Robust Policy Learning Across Environments", 1500),
+]
+
+
+def paragraph(rng, n_words):
+    sentences = []
+    while n_words > 0:
+        length = min(n_words, rng.randint(8, 20))
+        words = [rng.choice(WORDS) for _ in range(length)]
+        sentences.append(" ".join(words).capitalize() + ".")
+        n_words -= length
+    return " ".join(sentences)
+
+
+def figure(rng, width=480, height=320):
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    points = [(x, height // 2 + rng.randint(-height // 3, height // 3)) for x in range(0, width, 8)]
+    draw.line(points, fill=(30, 90, 200), width=3)
+    for _ in range(200):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.point((x, y), fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def write_text(doc, text, fontsize=10, width=95, lines_per_page=64):
+    """Wrap `text` and flow it over as many A4 pages as it needs; returns the last page."""
+    lines = [wrapped for line in text.split("\n") for wrapped in (textwrap.wrap(line, width) or [""])]
+    for start in range(0, len(lines), lines_per_page):
+        page = doc.new_page()
+        page.insert_text((50, 60), "\n".join(lines[start:start + lines_per_page]), fontsize=fontsize)
+    return doc[-1]
+
+
+def make_paper(path, title, section_words, seed):
+    rng = random.Random(seed)
+    lines = [title, "", "Abstract", paragraph(rng, 120), ""]
+    for number, section in enumerate(SECTIONS, 1):
+        lines += [f"{number} {section}", paragraph(rng, section_words), ""]
+    lines += ["References"] + [f"[{i}] {paragraph(rng, 12)}" for i in range(1, 21)]
+
+    doc = fitz.open()
+    write_text(doc, "\n".join(lines))
+    doc.new_page().insert_image(fitz.Rect(150, 100, 450, 300), stream=figure(rng))
+    # No creation date or random file id, so the output only changes when the content does
+    doc.set_metadata({'title': title})
+    doc.save(path, garbage=4, deflate=True, no_new_id=True)
+
+
+if __name__ == '__main__':
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for seed, (name, title, section_words) in enumerate(PAPERS):
+        make_paper(os.path.join(FIXTURES_DIR, name), title, section_words, seed)
+        print(os.path.join(FIXTURES_DIR, name))
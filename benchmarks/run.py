@@ -0,0 +1,171 @@
+"""
+Offline benchmarks of the pipeline stages: python -m benchmarks.run [--sizes 1 10 100] [--repeat 3]
+
+arXiv, OpenAI and Gmail are replaced by local servers (see benchmarks.servers), fed from the
+corpus in benchmarks/fixtures, so the numbers only depend on this code and this machine.
+For each stage and number of papers it reports throughput and p50/p95 latency per call.
+"""
+import argparse
+import copy
+import glob
+import json
+import logging
+import math
+import os
+import tempfile
+import time
+from xml.etree import ElementTree as ET
+
+from benchmarks.servers import FakeOpenAIServer, FileServer, SMTPSink
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+
+
+def percentile(samples, q):
+    """Nearest-rank percentile of `samples`."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def build_feed(n_papers, pdf_url):
+    """
+    An Atom feed of `n_papers` entries, cycling through the fixture feeds. Every entry gets a
+    unique id and title, and a PDF link to one of the fixture PDFs on the local file server.
+    """
+    ET.register_namespace('', ATOM_NS[1:-1])
+    feeds = [ET.parse(path).getroot() for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.atom.xml')))]
+    templates = [entry for feed in feeds for entry in feed.findall(f"{ATOM_NS}entry")]
+    pdfs = sorted(os.path.basename(path) for path in glob.glob(os.path.join(FIXTURES_DIR, '*.pdf')))
+
+    feed = copy.deepcopy(feeds[0])
+    for entry in feed.findall(f"{ATOM_NS}entry"):
+        feed.remove(entry)
+
+    for i in range(n_papers):
+        entry = copy.deepcopy(templates[i % len(templates)])
+        entry.find(f"{ATOM_NS}id").text += f"-{i}"
+        entry.find(f"{ATOM_NS}title").text += f" ({i})"
+        for link in entry.findall(f"{ATOM_NS}link"):
+            if link.attrib.get('title') == 'pdf':
+                # A distinct URL per paper, otherwise download_papers fetches each PDF only once
+                link.attrib['href'] = f"{pdf_url}/{i}/{pdfs[i % len(pdfs)]}"
+        feed.append(entry)
+    return ET.tostring(feed, encoding='utf-8', xml_declaration=True)
+
+
+class Benchmark:
+    def __init__(self):
+        self.results = []
+
+    def measure(self, stage, n_papers, func, *args):
+        """Run `func(*args)` once and return its result; the latency is recorded under (stage, n_papers)."""
+        start = time.perf_counter()
+        result = func(*args)
+        self.record(stage, n_papers, time.perf_counter() - start)
+        return result
+
+    def record(self, stage, n_papers, seconds):
+        for result in self.results:
+            if result['stage'] == stage and result['papers'] == n_papers:
+                break
+        else:
+            result = {'stage': stage, 'papers': n_papers, 'samples': [], 'processed': 0}
+            self.results.append(result)
+        result['samples'].append(seconds)
+
+    def add_processed(self, stage, n_papers, count):
+        for result in self.results:
+            if result['stage'] == stage and result['papers'] == n_papers:
+                result['processed'] += count
+
+    def summary(self):
+        rows = []
+        for result in self.results:
+            samples = result['samples']
+            total = sum(samples)
+            rows.append({
+                'stage': result['stage'],
+                'papers': result['papers'],
+                'calls': len(samples),
+                'throughput': result['processed'] / total if total else float('inf'),
+                'p50': percentile(samples, 50),
+                'p95': percentile(samples, 95),
+                'total': total,
+            })
+        return rows
+
+
+def run_size(benchmark, u, n_papers, repeat, feed, mailer):
+    for _ in range(repeat):
+        # A fresh download directory, so every repetition downloads everything again
+        u.PAPER_DIR = tempfile.mkdtemp(prefix='bench-papers-')
+
+        papers = benchmark.measure('parse_and_download_papers', n_papers, u.parse_and_download_papers, feed)
+        benchmark.add_processed('parse_and_download_papers', n_papers, len(papers))
+
+        for paper in papers:
+            text, images = benchmark.measure('extract_text_and_images', n_papers, u.extract_text_and_images,
+                                             paper['filename'])
+            chunks = benchmark.measure('split_into_chunks', n_papers, u.split_into_chunks, text)
+            paper['summaries'] = benchmark.measure('summarize_chunks', n_papers, u.summarize_chunks, chunks)
+            paper['text'] = text
+            paper['figures'] = images
+        for stage in ('extract_text_and_images', 'split_into_chunks', 'summarize_chunks'):
+            benchmark.add_processed(stage, n_papers, len(papers))
+
+        figures = u.prepare_figures(papers)
+        report = benchmark.measure('construct_report', n_papers, u.construct_report, papers)
+        benchmark.add_processed('construct_report', n_papers, len(papers))
+
+        message = u.build_email("Benchmark digest", report, "bench@example.com", images=figures)
+        benchmark.measure('send_batch', n_papers, mailer.send_batch, [message])
+        benchmark.add_processed('send_batch', n_papers, len(papers))
+
+
+def print_table(rows):
+    print(f"{'stage':<28}{'papers':>7}{'calls':>7}{'papers/s':>11}{'p50 (s)':>10}{'p95 (s)':>10}{'total (s)':>11}")
+    for row in rows:
+        print(f"{row['stage']:<28}{row['papers']:>7}{row['calls']:>7}{row['throughput']:>11.2f}"
+              f"{row['p50']:>10.4f}{row['p95']:>10.4f}{row['total']:>11.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100], help="numbers of papers")
+    parser.add_argument('--repeat', type=int, default=3, help="repetitions per size")
+    parser.add_argument('--llm-latency', type=float, default=0.05, help="seconds per fake OpenAI response")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    with FileServer(FIXTURES_DIR) as files, FakeOpenAIServer(args.llm_latency) as llm, SMTPSink() as smtp:
+        # Set before utils.utils is imported: its state and caches must not touch the real ones
+        os.environ['OPENAI_API_KEY'] = 'benchmark'
+        os.environ['OPENAI_BASE_URL'] = f"{llm.url}/v1"
+        os.environ['STATE_DIR'] = tempfile.mkdtemp(prefix='bench-state-')
+        os.environ['SUMMARY_CACHE_DIR'] = tempfile.mkdtemp(prefix='bench-cache-')
+
+        import utils.utils as u
+        from utils.cache import SummaryCache
+        from utils.mailer import SMTPMailer
+        logging.getLogger().setLevel(logging.WARNING)
+
+        # The corpus repeats the same few PDFs; a cache that keeps nothing makes every summary a cold one
+        u.summary_cache = SummaryCache(os.environ['SUMMARY_CACHE_DIR'], max_bytes=0)
+
+        benchmark = Benchmark()
+        with SMTPMailer('127.0.0.1', smtp.port, use_tls=False) as mailer:
+            for n_papers in args.sizes:
+                run_size(benchmark, u, n_papers, args.repeat, build_feed(n_papers, files.url), mailer)
+
+        rows = benchmark.summary()
+        print_table(rows)
+        print(f"\nLLM requests: {llm.requests}, emails: {smtp.messages} ({smtp.bytes} bytes)")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Local stand-ins for the network services of the pipeline: a static file server for the arXiv
+PDFs, a fake OpenAI chat completions API and an SMTP sink. Each runs on a free port in a
+background thread.
+"""
+import json
+import os
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class BackgroundServer:
+    """Runs a socketserver on 127.0.0.1 in a daemon thread; use as a context manager."""
+
+    server_class = ThreadingHTTPServer
+
+    def __init__(self, handler):
+        self.server = self.server_class(('127.0.0.1', 0), handler)
+        self.server.daemon_threads = True
+        self.server.owner = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = os.path.join(self.server.owner.root, os.path.basename(self.path))
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FileServer(BackgroundServer):
+    """Serves the files of `root` at /<file name>, like arxiv.org serves PDFs."""
+
+    def __init__(self, root):
+        self.root = root
+        super().__init__(FileHandler)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        owner = self.server.owner
+        time.sleep(owner.latency)
+        with owner.lock:
+            owner.requests += 1
+
+        if self.path.endswith('/chat/completions'):
+            prompts = ["".join(message.get('content') or "" for message in request.get('messages', []))]
+        else:
+            # Legacy completions, which take a single prompt or a batch of them
+            prompts = request.get('prompt', "")
+            prompts = [prompts] if isinstance(prompts, str) else prompts
+        completions = [f"Summary of {len(prompt)} characters: what was done, the process and the result."
+                       for prompt in prompts]
+
+        response = {
+            'id': f"cmpl-{uuid.uuid4().hex}",
+            'created': int(time.time()),
+            'model': request.get('model', 'fake'),
+            # Same 4 characters per token estimate as utils.chunker without tiktoken
+            'usage': {
+                'prompt_tokens': sum(len(prompt) for prompt in prompts) // 4,
+                'completion_tokens': sum(len(completion) for completion in completions) // 4,
+                'total_tokens': sum(len(text) for text in prompts + completions) // 4,
+            },
+        }
+        if self.path.endswith('/chat/completions'):
+            response['object'] = 'chat.completion'
+            response['choices'] = [{'index': 0, 'message': {'role': 'assistant', 'content': completions[0]},
+                                    'finish_reason': 'stop'}]
+        else:
+            response['object'] = 'text_completion'
+            response['choices'] = [{'index': i, 'text': completion, 'finish_reason': 'stop', 'logprobs': None}
+                                   for i, completion in enumerate(completions)]
+        body = json.dumps(response).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOpenAIServer(BackgroundServer):
+    """
+    Answers /v1/chat/completions and /v1/completions (also with a batch of prompts) after `latency`
+    seconds, with canned completions and token usage. Point the OpenAI client at it with
+    OPENAI_BASE_URL=<url>/v1, or use <url>/v1 as an endpoint of a local backend.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+        super().__init__(FakeOpenAIHandler)
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: every command is accepted, every message discarded."""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+    def handle(self):
+        owner = self.server.owner
+        self.reply("220 localhost SMTP sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip().upper()
+
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply("250-localhost")
+                self.reply("250 SIZE 104857600")
+            elif command == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                for data_line in iter(self.rfile.readline, b''):
+                    if data_line == b".\r\n":
+                        break
+                    size += len(data_line)
+                with owner.lock:
+                    owner.messages += 1
+                    owner.bytes += size
+                self.reply("250 OK")
+            elif command == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SMTPSink(BackgroundServer):
+    """Accepts mail on a local port and only counts it. Use with SMTPMailer(..., use_tls=False)."""
+
+    server_class = socketserver.ThreadingTCPServer
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+        super().__init__(SMTPSinkHandler)
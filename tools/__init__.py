@@ -4,4 +4,6 @@ from .url_call import call_api
 from .cli_executor import execute_cli_command
 from .input_tool import get_user_input
 from .output_tool import output_information
-from .file_reader import read_file
\ No newline at end of file
+from .file_reader import read_file
+from .search import search
+from .registry import TOOLS, tool, tool_schemas
\ No newline at end of file
@@ -1,11 +1,16 @@
 import subprocess
 
+from .registry import tool
 
-def execute_cli_command(command):
-    c = input(f"Executing command: {command} \n(y/n) :")
-    if c == "n":
-        return "User refused to execute this command"
 
+@tool(confirm="Executing command: {command} \n(y/n) :")
+def execute_cli_command(command: str):
+    """
+    Run a shell command on the user's machine and return its output. The user can answer prompts of the command.
+
+    Args:
+        command: the command line, e.g. 'vercel env pull'
+    """
     try:
         process = subprocess.Popen(command, shell=True, text=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
                                    stderr=subprocess.PIPE)
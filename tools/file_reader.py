@@ -1,10 +1,16 @@
 # file_reader.py
 
-def read_file(file_path):
-    c = input(f"Read file: {file_path}. (y/n)")
-    if c == "n":
-        return "User refused to read the file"
+from .registry import tool
 
+
+@tool(confirm="Read file: {file_path}. (y/n)", parallel=True)
+def read_file(file_path: str):
+    """
+    Return the content of a text file on the user's machine.
+
+    Args:
+        file_path: path of the file, e.g. '.env.local'
+    """
     try:
         content = ""
         with open(file_path, 'r', encoding='utf-8') as file:
@@ -1,4 +1,14 @@
 # input_tool.py
 
-def get_user_input(prompt="Please enter content: "):
+from .registry import tool
+
+
+@tool()
+def get_user_input(prompt: str = "Please enter content: "):
+    """
+    Ask the user a question and return the answer.
+
+    Args:
+        prompt: the question shown to the user
+    """
     return input(prompt+"\n")
@@ -2,8 +2,12 @@
 
 import os
 
+from .registry import tool
 
+
+@tool(parallel=True)
 def get_lib():
+    """Return the knowledge base: useful websites and CLI commands for setting up arXiv Sentinel, and what is known about the user."""
     lib = """
 Websites:
     Vercel's homepage. Vercel is a serverless function host platform, the arXiv sentinel should be deploy to this platform:
@@ -1,4 +1,15 @@
 # output_tool.py
 
-def output_information(info, title="Information"):
+from .registry import tool
+
+
+@tool()
+def output_information(info: str, title: str = "Information"):
+    """
+    Show information to the user.
+
+    Args:
+        info: the text to show
+        title: a short heading for it
+    """
     print(f"{title}: {info}")
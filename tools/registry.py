@@ -0,0 +1,94 @@
+# registry.py
+
+import inspect
+import re
+import typing
+
+# The assistant's tools by name, filled by the @tool decorator
+TOOLS = {}
+
+JSON_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    dict: "object",
+    list: "array",
+}
+
+
+def parse_docstring(doc):
+    """Split a docstring into its description and the descriptions of the parameters in its Args: section."""
+    doc = inspect.cleandoc(doc or "")
+    description, _, args = doc.partition("Args:")
+    params = {}
+    name = None
+    for line in args.splitlines():
+        match = re.match(r'\s*(\w+)\s*(?:\([^)]*\))?\s*:\s*(.*)', line)
+        if match:
+            name = match.group(1)
+            params[name] = match.group(2).strip()
+        elif name and line.strip():
+            params[name] += " " + line.strip()
+    return " ".join(description.split()), params
+
+
+def json_type(annotation):
+    """The JSON schema of a parameter annotated with `annotation`; unannotated parameters are strings."""
+    origin = typing.get_origin(annotation)
+    if origin is typing.Union:
+        # Optional[X] and X | None
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        return json_type(args[0]) if len(args) == 1 else {}
+    if origin is not None:
+        annotation = origin
+    if annotation is inspect.Parameter.empty:
+        return {"type": "string"}
+    return {"type": JSON_TYPES[annotation]} if annotation in JSON_TYPES else {}
+
+
+def function_schema(func, name=None):
+    """The OpenAI function-calling schema of `func`, from its signature, type hints and docstring."""
+    description, param_docs = parse_docstring(func.__doc__)
+    hints = typing.get_type_hints(func)
+    properties = {}
+    required = []
+    for param in inspect.signature(func).parameters.values():
+        if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+            continue
+        schema = json_type(hints.get(param.name, param.annotation))
+        if param.name in param_docs:
+            schema["description"] = param_docs[param.name]
+        properties[param.name] = schema
+        if param.default is inspect.Parameter.empty:
+            required.append(param.name)
+
+    return {
+        "type": "function",
+        "function": {
+            "name": name or func.__name__,
+            "description": description,
+            "parameters": {"type": "object", "properties": properties, "required": required},
+        },
+    }
+
+
+def tool(confirm=None, parallel=False):
+    """
+    Register the decorated function as a tool of the assistant.
+
+    `confirm` is a prompt, formatted with the call's arguments, the user must answer 'y' to before
+    the tool runs. Tools with `parallel` set only read (no side effects, no console input), so
+    several calls of them in one turn may run concurrently.
+    """
+    def decorator(func):
+        func.schema = function_schema(func)
+        func.confirm = confirm
+        func.parallel = parallel
+        TOOLS[func.__name__] = func
+        return func
+    return decorator
+
+
+def tool_schemas():
+    return [func.schema for func in TOOLS.values()]
@@ -1,28 +1,32 @@
-import os
 from langchain_core.tools import Tool
 from langchain_google_community import GoogleSearchAPIWrapper
 
+from .registry import tool
+
 # langchain_core
 # langchain_google_community
 
-def search(query, cse_id, api_key):
-    c = input(f"Google Search: {query} help\n(y/n)")
-    if c == "n":
-        return "User refused to search"
-
-    os.environ["GOOGLE_CSE_ID"] = cse_id
-    os.environ["GOOGLE_API_KEY"] = api_key
+@tool(confirm="Google Search: {query} help\n(y/n)", parallel=True)
+def search(query: str, cse_id: str, api_key: str):
+    """
+    Search Google and return the top results.
 
-    search = GoogleSearchAPIWrapper()
+    Args:
+        query: the search terms
+        cse_id: ID of the user's Google Programmable Search Engine
+        api_key: the user's Google API key
+    """
+    # Credentials go to the wrapper itself, not the process environment, so concurrent searches don't clash
+    search = GoogleSearchAPIWrapper(google_api_key=api_key, google_cse_id=cse_id)
 
-    tool = Tool(
+    google_search = Tool(
         name="google_search",
         description="Search Google for recent results.",
         func=search.run,
     )
 
     try:
-        result = tool.run(query)
+        result = google_search.run(query)
     except Exception as e:
         print(e)
         return e
@@ -2,11 +2,19 @@
 
 import requests
 
-def call_api(url, params=None, headers=None):
-    c = input(f"Call url: {url}. Params: {params}. (y/n)")
-    if c == "n":
-        return "User refused to call url"
+from .registry import tool
 
+
+@tool(confirm="Call url: {url}. Params: {params}. (y/n)", parallel=True)
+def call_api(url: str, params: dict = None, headers: dict = None):
+    """
+    Send a GET request to a JSON API and return the decoded response.
+
+    Args:
+        url: the API endpoint
+        params: query parameters
+        headers: HTTP headers
+    """
     try:
         response = requests.get(url, params=params, headers=headers)
         response.raise_for_status()  # Check HTTP status code
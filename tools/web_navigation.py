@@ -2,7 +2,17 @@
 
 import webbrowser
 
-def open_webpage(url):
+from .registry import tool
+
+
+@tool()
+def open_webpage(url: str):
+    """
+    Open a webpage in the user's browser.
+
+    Args:
+        url: the address of the page
+    """
     try:
         webbrowser.open(url)
         print(f"Opening {url}")
@@ -0,0 +1,161 @@
+import itertools
+import json
+import os
+import threading
+
+from utils.llm import gateway, LLM_MODEL, LLM_CONTEXT_TOKENS, LOCAL_LLM_URL, LOCAL_LLM_MODEL, LOCAL_LLM_CONTEXT_TOKENS
+
+# Backends by name, as JSON, merged over DEFAULT_BACKENDS. For example, three local servers:
+# {"local": {"type": "openai_compatible", "endpoints": ["http://gpu1:8000/v1", "http://gpu2:8000/v1",
+#  "http://gpu3:8000/v1"], "model": "llama3.1:8b", "routing": "least_loaded", "context_tokens": 16384,
+#  "batch_size": 8, "prompt_template": LLAMA3_PROMPT_TEMPLATE}}
+# `context_tokens` is the context window the servers run the model with; summaries are sized to it.
+LLM_BACKENDS = os.getenv('LLM_BACKENDS')
+
+DEFAULT_BACKENDS = {
+    'openai': {'type': 'openai'},
+    'local': {'type': 'openai_compatible', 'endpoints': [LOCAL_LLM_URL], 'model': LOCAL_LLM_MODEL, 'api_key': 'ollama',
+              'context_tokens': LOCAL_LLM_CONTEXT_TOKENS},
+}
+
+# Llama 3 instruct chat template for one user message, for batched completions of that model family
+LLAMA3_PROMPT_TEMPLATE = ("<|begin_of_text|><|start_header_id|>user<|end_header_id|>\n\n{prompt}<|eot_id|>"
+                          "<|start_header_id|>assistant<|end_header_id|>\n\n")
+
+
+class OpenAIBackend:
+    """
+    OpenAI's API (or OPENAI_BASE_URL). `model` overrides the model callers ask for, and
+    `context_tokens` is its context window.
+    """
+
+    batch_size = 1
+
+    def __init__(self, model=None, api_key=None, context_tokens=LLM_CONTEXT_TOKENS):
+        self.model = model
+        self.api_key = api_key
+        self.context_tokens = context_tokens
+
+    def chat_message(self, messages, model=LLM_MODEL, timeout=None, **kwargs):
+        """Return the reply message to `messages`, with its tool calls if `tools` were passed; failures are raised."""
+        completion = gateway.chat(messages, model=self.model or model, timeout=timeout, api_key=self.api_key, **kwargs)
+        return completion.choices[0].message
+
+    def chat(self, messages, model=LLM_MODEL, timeout=None, **kwargs):
+        """Return the text of the reply to `messages`; failures are raised."""
+        return self.chat_message(messages, model=model, timeout=timeout, **kwargs).content
+
+    def complete_batch(self, prompts, model=LLM_MODEL, timeout=None, **kwargs):
+        return [self.chat([{"role": "user", "content": prompt}], model=model, timeout=timeout, **kwargs)
+                for prompt in prompts]
+
+
+class EndpointPoolBackend(OpenAIBackend):
+    """
+    Several OpenAI-compatible servers (Ollama, vLLM, llama.cpp, ...) serving the same model.
+
+    Each request goes to the next endpoint ('round_robin') or to the one with the fewest requests
+    in flight ('least_loaded'). With `batch_size` > 1, `complete_batch` sends up to that many
+    prompts in one completions request; the servers must accept a list of prompts there.
+
+    The completions endpoint applies no chat template, so an instruct model would merely continue
+    the prompt. `prompt_template` wraps each batched prompt in the model's chat template
+    (e.g. LLAMA3_PROMPT_TEMPLATE); keep the default '{prompt}' only for base or completion-tuned models.
+    """
+
+    def __init__(self, endpoints, model, api_key='none', routing='round_robin', batch_size=1,
+                 context_tokens=LOCAL_LLM_CONTEXT_TOKENS, prompt_template='{prompt}'):
+        if not endpoints:
+            raise ValueError("An endpoint pool needs at least one endpoint")
+        if routing not in ('round_robin', 'least_loaded'):
+            raise ValueError(f"Unknown routing '{routing}'")
+        if batch_size > 1 and '{prompt}' not in prompt_template:
+            raise ValueError("prompt_template must contain '{prompt}'")
+        super().__init__(model, api_key, context_tokens)
+        self.endpoints = list(endpoints)
+        self.routing = routing
+        self.batch_size = max(1, batch_size)
+        self.prompt_template = prompt_template
+        self._lock = threading.Lock()
+        self._in_flight = {endpoint: 0 for endpoint in self.endpoints}
+        self._next = itertools.cycle(self.endpoints)
+
+    def _acquire(self):
+        with self._lock:
+            if self.routing == 'least_loaded':
+                # Ties go round robin, so an idle pool still spreads the load
+                start = next(self._next)
+                order = self.endpoints[self.endpoints.index(start):] + self.endpoints[:self.endpoints.index(start)]
+                endpoint = min(order, key=lambda e: self._in_flight[e])
+            else:
+                endpoint = next(self._next)
+            self._in_flight[endpoint] += 1
+            return endpoint
+
+    def _release(self, endpoint):
+        with self._lock:
+            self._in_flight[endpoint] -= 1
+
+    def chat_message(self, messages, model=None, timeout=None, **kwargs):
+        endpoint = self._acquire()
+        try:
+            completion = gateway.chat(messages, model=self.model, timeout=timeout, base_url=endpoint,
+                                      api_key=self.api_key, **kwargs)
+        finally:
+            self._release(endpoint)
+        return completion.choices[0].message
+
+    def complete_batch(self, prompts, model=None, timeout=None, **kwargs):
+        if self.batch_size == 1:
+            return super().complete_batch(prompts, timeout=timeout, **kwargs)
+
+        texts = []
+        for start in range(0, len(prompts), self.batch_size):
+            endpoint = self._acquire()
+            try:
+                batch = [self.prompt_template.replace('{prompt}', prompt) for prompt in prompts[start:start + self.batch_size]]
+                texts += gateway.complete(batch, model=self.model, timeout=timeout,
+                                          base_url=endpoint, api_key=self.api_key, **kwargs)
+            finally:
+                self._release(endpoint)
+        return texts
+
+
+BACKEND_TYPES = {
+    'openai': OpenAIBackend,
+    'openai_compatible': EndpointPoolBackend,
+}
+
+_lock = threading.Lock()
+_backends = {}
+
+
+def backend_configs():
+    configs = dict(DEFAULT_BACKENDS)
+    if LLM_BACKENDS:
+        configs.update(json.loads(LLM_BACKENDS))
+    return configs
+
+
+def register_backend(name, backend):
+    """
+    Make `backend` (anything with `chat`, `chat_message`, `complete_batch`, `batch_size` and
+    `context_tokens`) available as `name`.
+    """
+    with _lock:
+        _backends[name] = backend
+
+
+def get_backend(name):
+    """The backend called `name`, created from its config on first use."""
+    with _lock:
+        if name not in _backends:
+            configs = backend_configs()
+            if name not in configs:
+                raise KeyError(f"Unknown LLM backend '{name}', configured: {', '.join(configs)}")
+            config = dict(configs[name])
+            backend_type = config.pop('type', 'openai')
+            if backend_type not in BACKEND_TYPES:
+                raise ValueError(f"Unknown type '{backend_type}' of LLM backend '{name}'")
+            _backends[name] = BACKEND_TYPES[backend_type](**config)
+        return _backends[name]
@@ -0,0 +1,252 @@
+"""
+Backfill the paper archive with a category's papers over a date range:
+
+    python -m utils.backfill cs.AI 2024-01-01 2024-03-31
+
+Runs until the range is done. Progress is persisted per day, so an interrupted backfill resumes
+where it stopped when started again with the same arguments.
+"""
+import argparse
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from utils.utils import (iter_arxiv_entries, download_pdf, summarize_paper, find_original, record_extraction,
+                         state_store, paper_store, ARXIV_PAGE_DELAY, JOB_MAX_ATTEMPTS, STATE_DIR)
+from utils.pdf import extract_pdf
+from utils.dedup import minhash
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Papers processed concurrently, and fetched papers waiting for a worker; a full queue pauses fetching
+BACKFILL_WORKERS = int(os.getenv('BACKFILL_WORKERS', 4))
+BACKFILL_QUEUE_SIZE = int(os.getenv('BACKFILL_QUEUE_SIZE', 16))
+# Results per arXiv API call; the API serves at most 2000
+BACKFILL_PAGE_SIZE = int(os.getenv('BACKFILL_PAGE_SIZE', 100))
+
+BACKFILL_DIR = os.path.join(STATE_DIR, 'backfill')
+
+
+def progress_key(category, start_date, end_date):
+    return f"backfill:{category}:{start_date}:{end_date}"
+
+
+def iter_days(start_date, end_date):
+    day = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    while day <= end:
+        yield day.strftime('%Y-%m-%d')
+        day += timedelta(days=1)
+
+
+class ArxivPager:
+    """Pages through arXiv API queries, never calling the API more often than every ARXIV_PAGE_DELAY seconds."""
+
+    def __init__(self, page_size=BACKFILL_PAGE_SIZE):
+        self.page_size = page_size
+        self._last_call = None
+
+    def iter_day(self, category, day):
+        """Yield the papers of `category` submitted on `day` (YYYY-MM-DD), oldest first."""
+        stamp = day.replace('-', '')
+        start = 0
+        while True:
+            if self._last_call is not None:
+                time.sleep(max(0.0, self._last_call + ARXIV_PAGE_DELAY - time.monotonic()))
+            self._last_call = time.monotonic()
+
+            params = {
+                "search_query": f"cat:{category} AND submittedDate:[{stamp}0000 TO {stamp}2359]",
+                "sortBy": "submittedDate",
+                "sortOrder": "ascending",
+                "start": start,
+                "max_results": self.page_size,
+            }
+            # Read the whole page first; the consumer may block on a full queue for a long time
+            entries = list(iter_arxiv_entries(params))
+            yield from entries
+
+            if len(entries) < self.page_size:
+                return
+            start += self.page_size
+
+
+class BackfillProgress:
+    """
+    Persisted progress of one backfill: the first day not completely processed, counters and the
+    papers given up on. Days complete out of order, but the cursor only moves past a day once it
+    and every day before it are done.
+    """
+
+    def __init__(self, key, days):
+        self.key = key
+        self._lock = threading.Lock()
+        self.state = state_store.get(key) or {
+            'next_day': days[0] if days else None,
+            'processed': 0,
+            'reused': 0,
+            'failed': [],
+        }
+        self._days = []
+        self._pending = {}
+        self._next_days = {}
+
+    def open(self, day):
+        with self._lock:
+            self._days.append(day)
+            self._pending[day] = 0
+
+    def add(self, day):
+        with self._lock:
+            self._pending[day] += 1
+
+    def close(self, day, next_day):
+        """No more papers of `day` will be added; `next_day` is where a resume should start after it."""
+        with self._lock:
+            self._next_days[day] = next_day
+            self._advance()
+
+    def done(self, day, outcome, paper_id=None):
+        with self._lock:
+            self._pending[day] -= 1
+            if outcome == 'failed':
+                self.state['failed'].append(paper_id)
+            else:
+                self.state['processed'] += 1
+                if outcome == 'reused':
+                    self.state['reused'] += 1
+            self._advance()
+
+    def _advance(self):
+        moved = False
+        while self._days and self._days[0] in self._next_days and self._pending[self._days[0]] == 0:
+            day = self._days.pop(0)
+            self.state['next_day'] = self._next_days[day]
+            moved = True
+        if moved:
+            self.state['updated_at'] = time.time()
+            state_store.set(self.key, self.state)
+            logger.info(f"Backfill {self.key}: {self.state['processed']} papers archived, "
+                        f"resuming at {self.state['next_day'] or 'the end'}")
+
+
+def backfill_paper(entry, category):
+    """Download, extract and summarize one paper and archive it; returns 'archived' or 'reused'."""
+    abstract = entry.get('abstract') or ""
+    signatures = {'abstract': minhash(abstract)}
+
+    # A version or near-duplicate of an archived paper needs neither a download nor an LLM call
+    found = find_original(entry, 'abstract', signatures['abstract'])
+    if found is not None:
+        original = found[0]
+        text = original.get('text') or ""
+        signatures['text'] = minhash(text)
+        summaries = [s for s in original['summaries'] if not s['title'].startswith("Changes since ")]
+        outcome = 'reused'
+    else:
+        safe_id = re.sub(r'[^\w.-]', '_', entry['id'])
+        filename = os.path.join(BACKFILL_DIR, f"{safe_id}.pdf")
+        try:
+            download_pdf(entry['pdf_link'], filename)
+            extraction = extract_pdf(filename)
+        finally:
+            for path in (filename, f"{filename}.sha256"):
+                if os.path.exists(path):
+                    os.remove(path)
+        record_extraction(extraction)
+        text = extraction['text']
+        signatures['text'] = minhash(text)
+
+        found = find_original(entry, 'text', signatures['text'])
+        if found is not None:
+            summaries = [s for s in found[0]['summaries'] if not s['title'].startswith("Changes since ")]
+            outcome = 'reused'
+        else:
+            summaries = summarize_paper(text, abstract)
+            if any((s['summary'] or "").startswith("Exception:") for s in summaries):
+                raise Exception("summarization failed")
+            outcome = 'archived'
+
+    paper_store.add_papers([dict(entry, topic=category, text=text, summaries=summaries, signatures=signatures)])
+    return outcome
+
+
+def backfill(category, start_date, end_date, workers=BACKFILL_WORKERS, queue_size=BACKFILL_QUEUE_SIZE):
+    """
+    Archive every paper of `category` submitted between `start_date` and `end_date` (YYYY-MM-DD,
+    inclusive). One thread pages through the arXiv API day by day and feeds a bounded queue;
+    `workers` threads take papers from it through download, extraction and summarization.
+    Returns the persisted progress.
+    """
+    os.makedirs(BACKFILL_DIR, exist_ok=True)
+    days = list(iter_days(start_date, end_date))
+    progress = BackfillProgress(progress_key(category, start_date, end_date), days)
+    if progress.state['next_day'] is None:
+        logger.info(f"Backfill of {category} from {start_date} to {end_date} is already complete")
+        return progress.state
+    days = days[days.index(progress.state['next_day']):]
+    logger.info(f"Backfilling {category} from {days[0]} to {end_date} with {workers} workers")
+
+    work = queue.Queue(maxsize=queue_size)
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            day, entry = item
+            for attempt in range(1, JOB_MAX_ATTEMPTS + 1):
+                try:
+                    with tracer.span('backfill', papers=1):
+                        outcome = backfill_paper(entry, category)
+                    break
+                except Exception as e:
+                    logger.error(f"Attempt {attempt} on paper {entry['id']} failed: {e}")
+            else:
+                outcome = 'failed'
+            progress.done(day, outcome, entry['id'])
+
+    threads = [threading.Thread(target=worker, name=f"backfill-{i}", daemon=True) for i in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+
+    pager = ArxivPager()
+    try:
+        for i, day in enumerate(days):
+            progress.open(day)
+            for entry in pager.iter_day(category, day):
+                # Papers archived before an interruption are not redone
+                if paper_store.get(entry['id'], with_text=False) is not None:
+                    continue
+                progress.add(day)
+                work.put((day, entry))
+            progress.close(day, days[i + 1] if i + 1 < len(days) else None)
+    except BaseException:
+        # Interrupted: drop the queued papers, they are fetched again on resume
+        while not work.empty():
+            work.get_nowait()
+        raise
+    finally:
+        for _ in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+
+    logger.info(f"Backfill done: {progress.state['processed']} papers archived "
+                f"({progress.state['reused']} reused), {len(progress.state['failed'])} failed")
+    return progress.state
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('category', help="arXiv category, e.g. cs.AI")
+    parser.add_argument('start_date', help="first submission day, YYYY-MM-DD")
+    parser.add_argument('end_date', help="last submission day, YYYY-MM-DD")
+    parser.add_argument('--workers', type=int, default=BACKFILL_WORKERS)
+    args = parser.parse_args()
+    backfill(args.category, args.start_date, args.end_date, workers=args.workers)
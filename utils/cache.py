@@ -0,0 +1,119 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class SummaryCache:
+    """
+    Persistent LLM summary cache backed by SQLite.
+
+    Entries are keyed by a hash of (prompt template, model, chunk content), expire
+    after `ttl` seconds and are evicted least-recently-used first once the stored
+    summaries exceed `max_bytes`.
+    """
+
+    def __init__(self, cache_dir, ttl=7 * 24 * 3600, max_bytes=64 * 1024 * 1024):
+        self.path = os.path.join(cache_dir, 'summaries.sqlite3')
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        # LLM time avoided by serving hits from the cache
+        self.saved_seconds = 0.0
+
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(template, model, content):
+        digest = hashlib.sha256()
+        for part in (template, model, content):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS summaries (
+                    key TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    elapsed REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS summaries_accessed ON summaries (accessed_at)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key):
+        """Return the cached summary for `key`, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT summary, elapsed, created_at FROM summaries WHERE key = ?", (key,)).fetchone()
+
+            if row is not None and now - row[2] > self.ttl:
+                conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                conn.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            conn.execute("UPDATE summaries SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            self.saved_seconds += row[1]
+            return row[0]
+
+    def set(self, key, summary, elapsed=0.0):
+        """Store `summary`, recording how long the LLM call took to produce it."""
+        now = time.time()
+        size = len(summary.encode('utf-8'))
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, size, elapsed, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, summary, size, elapsed, now, now))
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM summaries WHERE created_at < ?", (now - self.ttl,))
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        stale = []
+        for key, size in conn.execute("SELECT key, size FROM summaries ORDER BY accessed_at"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM summaries WHERE key = ?", stale)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'saved_seconds': round(self.saved_seconds, 3),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,165 @@
+import functools
+import os
+import re
+
+# Target size of one chunk sent to the LLM, and how much of the previous chunk is repeated for context
+CHUNK_TARGET_TOKENS = int(os.getenv('CHUNK_TARGET_TOKENS', 2000))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', 100))
+
+# Numbered headings ("1. Introduction", "3.2 Training Setup", "IV. RESULTS") and the usual
+# unnumbered ones, each on a line of their own
+HEADING_PATTERN = re.compile(
+    r'^[ \t]*('
+    r'(?:\d+(?:\.\d+)*\.?|[IVX]+\.)[ \t]+[A-Z][^\n]{0,80}'
+    r'|(?i:abstract|introduction|related work|background|preliminaries|methods?|methodology|approach'
+    r'|experiments?|experimental setup|evaluation|results|discussion|limitations|conclusions?'
+    r'|references|bibliography|acknowledge?ments?|appendix[^\n]{0,60})'
+    r')[ \t]*$',
+    re.MULTILINE)
+
+# Sections that cost tokens without adding anything to a summary
+SKIPPED_SECTIONS = re.compile(r'^(?:\d+\.?\s+)?(?:references|bibliography)$', re.IGNORECASE)
+
+# Titles of text that doesn't come with a heading of its own
+PREAMBLE = "Preamble"
+FULL_TEXT = "Full text"
+UNTITLED_SECTIONS = (PREAMBLE, FULL_TEXT)
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding():
+    """The tiktoken encoding if available, otherwise None (token counts are then estimated)."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is None:
+        # Roughly 4 characters per token for English text
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, tokens):
+    """The first `tokens` tokens of `text`, by the same count as `count_tokens`."""
+    encoding = get_encoding()
+    if encoding is None:
+        return text[:tokens * 4]
+    ids = encoding.encode(text, disallowed_special=())
+    return text if len(ids) <= tokens else encoding.decode(ids[:tokens])
+
+
+def build_heading_index(text):
+    """Return (start, end, title) for every section heading detected in `text`."""
+    return [(match.start(), match.end(), match.group(1).strip()) for match in HEADING_PATTERN.finditer(text)]
+
+
+def find_sections(text):
+    """Split `text` into (title, content) sections along the detected headings."""
+    index = build_heading_index(text)
+    if not index:
+        return [(FULL_TEXT, text.strip())]
+
+    sections = []
+    preamble = text[:index[0][0]].strip()
+    if preamble:
+        sections.append((PREAMBLE, preamble))
+
+    for i, (_, end, title) in enumerate(index):
+        next_start = index[i + 1][0] if i + 1 < len(index) else len(text)
+        content = text[end:next_start].strip()
+        if content and not SKIPPED_SECTIONS.match(title):
+            sections.append((title, content))
+    return sections
+
+
+def tail_words(text, tokens):
+    """The last words of `text` worth about `tokens` tokens, used as overlap for the next chunk."""
+    words = text.split()
+    if not words or tokens <= 0:
+        return ""
+    per_word = max(count_tokens(text) / len(words), 1e-6)
+    return " ".join(words[-max(1, int(tokens / per_word)):])
+
+
+def split_units(content, target_tokens):
+    """Paragraphs of `content`, with paragraphs above `target_tokens` cut into word windows."""
+    units = []
+    for paragraph in re.split(r'\n\s*\n', content):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+
+        tokens = count_tokens(paragraph)
+        if tokens <= target_tokens:
+            units.append((paragraph, tokens))
+            continue
+
+        words = paragraph.split()
+        window = max(1, int(len(words) * target_tokens / tokens))
+        for i in range(0, len(words), window):
+            piece = " ".join(words[i:i + window])
+            units.append((piece, count_tokens(piece)))
+    return units
+
+
+def split_section(title, content, target_tokens, overlap_tokens):
+    pieces = []
+    current, current_tokens = [], 0
+    # Leave room for the overlap carried over from the previous piece
+    for unit, tokens in split_units(content, max(1, target_tokens - overlap_tokens)):
+        if current and current_tokens + tokens > target_tokens:
+            pieces.append("\n\n".join(current))
+            overlap = tail_words(pieces[-1], overlap_tokens)
+            current = [overlap] if overlap else []
+            current_tokens = count_tokens(overlap) if overlap else 0
+        current.append(unit)
+        current_tokens += tokens
+    if current:
+        pieces.append("\n\n".join(current))
+
+    if len(pieces) == 1:
+        return [{'title': title, 'content': pieces[0], 'tokens': count_tokens(pieces[0])}]
+    return [{'title': f"{title} (part {i})", 'content': piece, 'tokens': count_tokens(piece)}
+            for i, piece in enumerate(pieces, start=1)]
+
+
+def chunk_text(text, target_tokens=CHUNK_TARGET_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Split a paper into chunks of about `target_tokens` tokens, following section boundaries.
+
+    Small consecutive sections are packed into one chunk, and sections over the budget are
+    split on paragraphs (then words) with `overlap_tokens` of overlap. References are dropped.
+    """
+    chunks = []
+    pending = None
+
+    for title, content in find_sections(text):
+        tokens = count_tokens(content)
+        if tokens > target_tokens:
+            if pending:
+                chunks.append(pending)
+                pending = None
+            chunks.extend(split_section(title, content, target_tokens, overlap_tokens))
+            continue
+
+        section_text = content if title in UNTITLED_SECTIONS else f"{title}\n{content}"
+        section_tokens = count_tokens(section_text)
+        if pending and pending['tokens'] + section_tokens <= target_tokens:
+            pending = {
+                'title': f"{pending['title']} / {title}",
+                'content': f"{pending['content']}\n\n{section_text}",
+                'tokens': pending['tokens'] + section_tokens,
+            }
+        else:
+            if pending:
+                chunks.append(pending)
+            pending = {'title': title, 'content': section_text, 'tokens': section_tokens}
+
+    if pending:
+        chunks.append(pending)
+    return chunks
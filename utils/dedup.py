@@ -0,0 +1,67 @@
+import array
+import hashlib
+import os
+import random
+import re
+import zlib
+
+# MinHash signature length, and the LSH banding of it: 16 bands of 8 rows make pairs above ~0.7
+# Jaccard similarity very likely to share a bucket, and pairs below ~0.4 very unlikely to
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 16
+# Words per shingle
+SHINGLE_SIZE = 3
+# Estimated Jaccard similarity from which two papers count as the same work
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', 0.8))
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Fixed seed: signatures are persisted and must stay comparable between runs
+_rng = random.Random(1)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+                 for _ in range(MINHASH_PERMUTATIONS)]
+
+ARXIV_VERSION = re.compile(r'v\d+$')
+
+
+def base_id(paper_id):
+    """The arXiv id without its version suffix, e.g. 2410.01002 for 2410.01002v2."""
+    return ARXIV_VERSION.sub('', paper_id)
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Stable 32-bit hashes of the word `size`-grams of `text`, ignoring case and punctuation."""
+    words = re.findall(r'\w+', text.lower())
+    size = min(size, len(words))
+    return {zlib.crc32(" ".join(words[i:i + size]).encode('utf-8'))
+            for i in range(len(words) - size + 1)} if words else set()
+
+
+def minhash(text):
+    """MinHash signature of `text`, or None if it has no words."""
+    hashes = shingles(text)
+    if not hashes:
+        return None
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MAX_HASH for a, b in _PERMUTATIONS]
+
+
+def similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    return sum(a == b for a, b in zip(signature_a, signature_b)) / len(signature_a)
+
+
+def lsh_buckets(signature, bands=LSH_BANDS):
+    """One bucket key per band; near-duplicate signatures share at least one with high probability."""
+    rows = len(signature) // bands
+    return [hashlib.blake2b(array.array('Q', signature[band * rows:(band + 1) * rows]).tobytes(),
+                            digest_size=8).hexdigest()
+            for band in range(bands)]
+
+
+def pack_signature(signature):
+    return array.array('Q', signature).tobytes()
+
+
+def unpack_signature(blob):
+    return array.array('Q', blob).tolist()
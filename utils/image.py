@@ -1,6 +1,20 @@
 import fitz  # PyMuPDF
 from PIL import Image
+import io
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Figures sent by email are downsampled to this edge length and re-encoded under this many bytes
+THUMBNAIL_MAX_EDGE = int(os.getenv('THUMBNAIL_MAX_EDGE', 800))
+THUMBNAIL_MAX_BYTES = int(os.getenv('THUMBNAIL_MAX_BYTES', 150 * 1024))
+# 'JPEG' (progressive) or 'WEBP'
+THUMBNAIL_FORMAT = os.getenv('THUMBNAIL_FORMAT', 'JPEG').upper()
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 4))
+
+THUMBNAIL_QUALITIES = (85, 75, 65, 50, 35)
 
 def extract_images_from_pdf(pdf_path, output_dir=None):
     """
@@ -50,6 +64,78 @@ def extract_images_from_pdf(pdf_path, output_dir=None):
     return image_paths
 
 
+def flatten_image(image):
+    """Convert to RGB, compositing transparent images onto white."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def encode_image(image, fmt=THUMBNAIL_FORMAT, quality=85):
+    buffer = io.BytesIO()
+    if fmt == 'WEBP':
+        image.save(buffer, 'WEBP', quality=quality, method=4)
+    else:
+        image.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def make_thumbnail(image_bytes, max_edge=THUMBNAIL_MAX_EDGE, max_bytes=THUMBNAIL_MAX_BYTES, fmt=THUMBNAIL_FORMAT):
+    """
+    Downsample an image to at most `max_edge` pixels on its longest side and re-encode it
+    (progressive JPEG or WebP) under `max_bytes`, lowering the quality first and then the size.
+
+    Parameters:
+        image_bytes (bytes): The original image, in any format Pillow can decode.
+        max_edge (int): Maximum width or height of the thumbnail.
+        max_bytes (int): Byte budget of the encoded thumbnail.
+        fmt (str): 'JPEG' or 'WEBP'.
+
+    Returns:
+        bytes: The encoded thumbnail, or None if the image can't be decoded or re-encoded.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        # Lets the JPEG decoder skip straight to a reduced scale
+        image.draft('RGB', (max_edge, max_edge))
+        # Image.open only reads the header; decode now so truncated files fail here
+        image.load()
+        image = flatten_image(image)
+        image.thumbnail((max_edge, max_edge))
+        return fit_thumbnail(image, max_bytes, fmt)
+    except Exception as e:
+        logger.warning(f"Unable to thumbnail image: {e}")
+        return None
+
+
+def fit_thumbnail(image, max_bytes, fmt):
+    """Encode `image` under `max_bytes`, lowering the quality first and then the size."""
+    while True:
+        for quality in THUMBNAIL_QUALITIES:
+            data = encode_image(image, fmt, quality)
+            if len(data) <= max_bytes:
+                return data
+
+        width, height = image.size
+        if max(width, height) <= 64:
+            return data
+        image = image.resize((max(1, width * 3 // 4), max(1, height * 3 // 4)))
+
+
+def make_thumbnails(images, max_workers=THUMBNAIL_WORKERS, **kwargs):
+    """Thumbnail `images` in parallel; results keep the input order (None for undecodable images)."""
+    if not images:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(images)))) as executor:
+        return list(executor.map(lambda image_bytes: make_thumbnail(image_bytes, **kwargs), images))
+
+
 # import fitz  # PyMuPDF
 # import io
 # from PIL import Image
@@ -1,24 +1,267 @@
+import email.utils
 import os
+import random
+import re
+import threading
+import time
 
 import openai
 
-def invoke_llm(prompt: str) -> str:
-    openai.api_key = os.getenv('OPENAI_API_KEY')
+from utils.tracing import tracer
 
-    client = openai.OpenAI(
-        api_key=openai.api_key,
-    )
+LLM_MODEL = "gpt-4o"
+# Used where a cheaper model is good enough, e.g. summarizing an abstract
+LLM_CHEAP_MODEL = "gpt-4o-mini"
+# Context window of LLM_MODEL, in tokens
+LLM_CONTEXT_TOKENS = 128000
+
+# Default time budget of one call in seconds, covering retries and rate-limit waits
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 60))
+# Retries of rate-limited (429), failed (5xx) or dropped requests, with jittered exponential backoff
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 4))
+LLM_RETRY_BACKOFF = float(os.getenv('LLM_RETRY_BACKOFF', 1.0))
+
+LOCAL_LLM_URL = 'http://localhost:11434/v1/'
+LOCAL_LLM_MODEL = 'llama3.1:8b'
+# Context window the local server runs LOCAL_LLM_MODEL with (Ollama's num_ctx), not the model's maximum
+LOCAL_LLM_CONTEXT_TOKENS = 4096
+
+
+def parse_reset(value):
+    """Seconds in an x-ratelimit-reset-* header value such as '20ms', '1s' or '6m0s'."""
+    parts = re.findall(r'([\d.]+)(ms|s|m|h)', value or "")
+    if not parts:
+        return None
+    units = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def parse_retry_after(headers):
+    """Seconds the server asked us to wait before retrying, or None."""
+    value = headers.get('retry-after-ms')
+    if value and value.replace('.', '', 1).isdigit():
+        return float(value) / 1000
+
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    if value.replace('.', '', 1).isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    A bucket of `capacity` units that refills at `rate` units per second. It is unlimited
+    until `update` has been told the server's limits.
+    """
+
+    def __init__(self):
+        self.capacity = None
+        self.level = None
+        self.rate = None
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def update(self, limit, remaining, reset):
+        """Sync with the server: `remaining` of `limit` left, and the bucket is full again after `reset` seconds."""
+        if limit is None or remaining is None:
+            return
+        self._refill()
+        self.capacity = limit
+        self.level = remaining
+        # OpenAI windows are one minute and refill continuously
+        self.rate = max((limit - remaining) / reset if reset else 0.0, limit / 60)
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units are available, 0 if they are now."""
+        self._refill()
+        if self.capacity is None:
+            return 0.0
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def consume(self, amount):
+        if self.capacity is not None:
+            self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """Request and token buckets of one model on an API endpoint, kept in sync with its x-ratelimit-* response headers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = TokenBucket()
+        self.tokens = TokenBucket()
+
+    def acquire(self, tokens, timeout=None):
+        """Wait until a request of about `tokens` tokens fits the limits; False if that takes longer than `timeout`."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if not wait:
+                    self.requests.consume(1)
+                    self.tokens.consume(tokens)
+                    return True
+
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            tracer.record('llm_throttle', wait)
+            time.sleep(wait)
+
+    def update(self, headers):
+        def number(name):
+            try:
+                return int(headers.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        with self._lock:
+            self.requests.update(number('x-ratelimit-limit-requests'), number('x-ratelimit-remaining-requests'),
+                                 parse_reset(headers.get('x-ratelimit-reset-requests')))
+            self.tokens.update(number('x-ratelimit-limit-tokens'), number('x-ratelimit-remaining-tokens'),
+                               parse_reset(headers.get('x-ratelimit-reset-tokens')))
+
+
+class LLMGateway:
+    """
+    Shared entry point for LLM requests.
 
+    Keeps one client, and with it one pool of keep-alive connections, per API endpoint, and paces
+    requests to the rate limits of each model on it. Rate-limited (429), failed (5xx) and dropped
+    requests are retried with jittered exponential backoff, as long as the call's time budget allows.
+    """
+
+    def __init__(self, max_retries=LLM_MAX_RETRIES, backoff=LLM_RETRY_BACKOFF, timeout=LLM_TIMEOUT):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._limiters = {}
+
+    def client(self, base_url=None, api_key=None):
+        """The pooled client of `base_url` (OPENAI_BASE_URL, or OpenAI's API, if None)."""
+        base_url = base_url or os.getenv('OPENAI_BASE_URL')
+        key = (base_url, api_key)
+        with self._lock:
+            if key not in self._clients:
+                # The client must not retry on its own; retries here respect the rate limiter and the budget
+                self._clients[key] = openai.OpenAI(
+                    api_key=api_key or os.getenv('OPENAI_API_KEY'),
+                    base_url=base_url or openai.NOT_GIVEN,
+                    max_retries=0,
+                )
+            return self._clients[key]
+
+    def limiter(self, model, base_url=None, api_key=None):
+        """The rate limiter of `model` on `base_url`; the x-ratelimit-* headers it learns from are per model."""
+        key = (base_url or os.getenv('OPENAI_BASE_URL'), api_key, model)
+        with self._lock:
+            if key not in self._limiters:
+                self._limiters[key] = RateLimiter()
+            return self._limiters[key]
+
+    def _is_transient(self, error):
+        if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code == 429 or error.status_code >= 500
+        return False
+
+    def _request(self, create, model, tokens, timeout, base_url, api_key):
+        """Send `create(client, timeout)` within the rate limits, retrying transient failures; returns the parsed response."""
+        client = self.client(base_url, api_key)
+        limiter = self.limiter(model, base_url, api_key)
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                if not limiter.acquire(tokens, timeout=deadline - time.monotonic()):
+                    raise TimeoutError("Timed out waiting for the rate limit")
+                response = create(client, max(deadline - time.monotonic(), 0.001))
+                limiter.update(response.headers)
+                result = response.parse()
+            except Exception as e:
+                delay = None
+                if isinstance(e, openai.APIStatusError):
+                    limiter.update(e.response.headers)
+                    delay = parse_retry_after(e.response.headers)
+                if delay is None:
+                    delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+                if attempt == self.max_retries or not self._is_transient(e) or time.monotonic() + delay >= deadline:
+                    tracer.record_llm_call(model, time.perf_counter() - start, error=str(e))
+                    raise
+                tracer.record('llm_retry', delay)
+                time.sleep(delay)
+                continue
+
+            usage = result.usage
+            tracer.record_llm_call(model, time.perf_counter() - start,
+                                   prompt_tokens=usage.prompt_tokens if usage else 0,
+                                   completion_tokens=usage.completion_tokens if usage else 0)
+            return result
+
+    def chat(self, messages, model=LLM_MODEL, timeout=None, base_url=None, api_key=None, **kwargs):
+        """
+        Create a chat completion and return it. `timeout` (seconds, LLM_TIMEOUT if None) bounds
+        the whole call, including rate-limit waits and retries. Other arguments go to the API.
+        """
+        # What the call may cost in tokens: the prompt (about 4 characters per token) and the completion
+        tokens = sum(len(message.get('content') or "") for message in messages) // 4 + kwargs.get('max_tokens', 0)
+
+        def create(client, remaining):
+            return client.chat.completions.with_raw_response.create(
+                messages=messages, model=model, timeout=remaining, **kwargs)
+
+        return self._request(create, model, tokens, timeout, base_url, api_key)
+
+    def complete(self, prompts, model, timeout=None, base_url=None, api_key=None, **kwargs):
+        """
+        One legacy completions request for a list of `prompts`; returns their texts in order.
+        Only for servers whose /v1/completions accepts a batch of prompts (e.g. vLLM, llama.cpp).
+        """
+        tokens = sum(len(prompt) for prompt in prompts) // 4 + kwargs.get('max_tokens', 0) * len(prompts)
+
+        def create(client, remaining):
+            return client.completions.with_raw_response.create(
+                prompt=prompts, model=model, timeout=remaining, **kwargs)
+
+        completion = self._request(create, model, tokens, timeout, base_url, api_key)
+        texts = [None] * len(prompts)
+        for choice in completion.choices:
+            texts[choice.index] = choice.text
+        if any(text is None for text in texts):
+            raise ValueError(f"Batch of {len(prompts)} prompts got {len(completion.choices)} completions")
+        return texts
+
+
+gateway = LLMGateway()
+
+
+def invoke_llm(prompt: str, timeout: float = None, model: str = LLM_MODEL, max_tokens: int = 3000) -> str:
     try:
-        response = client.chat.completions.create(
+        response = gateway.chat(
             messages=[
                 {
                     "role": "user",
                     "content": prompt,
                 }
             ],
-            model="gpt-4o",
-            max_tokens=3000,
+            model=model,
+            max_tokens=max_tokens,
+            timeout=timeout,
         )
 
         output = response.choices[0].message.content
@@ -28,13 +271,7 @@ def invoke_llm(prompt: str) -> str:
     return output
 
 def invoke_llm_(msg: list) -> str:
-    openai.api_key = os.getenv('OPENAI_API_KEY')
-
-    client = openai.OpenAI(
-        api_key=openai.api_key,
-    )
-
-    chat_completion = client.chat.completions.create(
+    chat_completion = gateway.chat(
         messages=msg,
         model='gpt-4o',
         temperature=0
@@ -44,14 +281,11 @@ def invoke_llm_(msg: list) -> str:
     return chat_completion.choices[0].message.content
 
 def invoke_local_llm(msg: list) -> str:
-    client = openai.OpenAI(
-        base_url='http://localhost:11434/v1/',
-        api_key='ollama',
-    )
-
-    chat_completion = client.chat.completions.create(
+    chat_completion = gateway.chat(
         messages=msg,
-        model='llama3.1:8b',
+        model=LOCAL_LLM_MODEL,
+        base_url=LOCAL_LLM_URL,
+        api_key='ollama',
         temperature=0
     )
 
@@ -62,4 +296,4 @@ if __name__ == '__main__':
     print(invoke_local_llm([{
         "role": "user",
         "content": "how are you?",
-    }]))
\ No newline at end of file
+    }]))
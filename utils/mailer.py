@@ -0,0 +1,98 @@
+import logging
+import random
+import smtplib
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPMailer:
+    """
+    Sends messages over one authenticated SMTP session that is kept open between messages.
+
+    Transient failures (4xx replies) are retried with jittered exponential backoff, and a
+    dropped connection is re-established before retrying. Permanent failures (5xx) are raised.
+    Point it at a local `aiosmtpd` server with `use_tls=False` and no credentials for testing.
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_tls=True, timeout=30,
+                 max_retries=3, backoff=1.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._server = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connect(self):
+        if self._server is None:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                if self.use_tls:
+                    server.starttls()
+                if self.username:
+                    server.login(self.username, self.password)
+            except Exception:
+                server.close()
+                raise
+            self._server = server
+        return self._server
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except smtplib.SMTPException:
+                self._server.close()
+            except OSError:
+                pass
+            self._server = None
+
+    def _is_transient(self, error):
+        if isinstance(error, (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)):
+            return True
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            return all(400 <= code < 500 for code, _ in error.recipients.values())
+        if isinstance(error, smtplib.SMTPResponseException):
+            return 400 <= error.smtp_code < 500
+        return False
+
+    def send(self, message):
+        """Send one prepared MIME message, retrying transient failures."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.connect().send_message(message)
+                return
+            except (smtplib.SMTPException, OSError) as e:
+                if attempt == self.max_retries or not self._is_transient(e):
+                    raise
+
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning(f"Transient SMTP failure ({e}), retrying in {delay:.1f}s")
+                # Start the retry on a fresh session; the old one may be dead or in a bad state
+                self.close()
+                time.sleep(delay)
+
+    def send_batch(self, messages):
+        """
+        Send `messages` over the shared session. A message that still fails after retries is
+        logged and skipped; returns the list of (message, error) failures.
+        """
+        failures = []
+        for message in messages:
+            try:
+                self.send(message)
+                logger.info(f"Email sent to {message['To']}")
+            except Exception as e:
+                logger.error(f"Failed to send email to {message['To']}: {e}")
+                failures.append((message, e))
+        return failures
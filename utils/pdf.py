@@ -0,0 +1,202 @@
+import hashlib
+import itertools
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+import PyPDF2
+
+logger = logging.getLogger(__name__)
+
+# 'pymupdf' walks the document once for text and images; 'pypdf2' is the original two-pass path
+PDF_BACKEND = os.getenv('PDF_BACKEND', 'pymupdf')
+
+# Worker processes for parsing PDFs ahead of summarization; 1 parses in-process
+PDF_PARSE_WORKERS = int(os.getenv('PDF_PARSE_WORKERS', os.cpu_count() or 1))
+
+# Images below these sizes are logos and icons, never figures worth sending
+MIN_FIGURE_WIDTH = int(os.getenv('MIN_FIGURE_WIDTH', 100))
+MIN_FIGURE_HEIGHT = int(os.getenv('MIN_FIGURE_HEIGHT', 100))
+MIN_FIGURE_BYTES = int(os.getenv('MIN_FIGURE_BYTES', 2048))
+# Figures kept per paper, largest first; the report references this many
+FIGURES_PER_PAPER = int(os.getenv('FIGURES_PER_PAPER', 1))
+
+
+def image_stream_length(doc, xref):
+    """Size of the image's (still encoded) stream, read from the PDF dictionary, or None if unknown."""
+    kind, value = doc.xref_get_key(xref, "Length")
+    return int(value) if kind == 'int' else None
+
+
+def iter_page_figures(doc, page, seen_xrefs, min_width=MIN_FIGURE_WIDTH, min_height=MIN_FIGURE_HEIGHT,
+                      min_bytes=MIN_FIGURE_BYTES):
+    """
+    Yield figure candidates of `page` as metadata only; no image data is decoded.
+
+    Images whose xref was already seen on an earlier page, and images below the size
+    thresholds (logos, icons, rules), are skipped.
+    """
+    for img in page.get_images(full=True):
+        xref, width, height = img[0], img[2], img[3]
+        if xref in seen_xrefs:
+            continue
+        seen_xrefs.add(xref)
+
+        if width < min_width or height < min_height:
+            continue
+        length = image_stream_length(doc, xref)
+        if length is not None and length < min_bytes:
+            continue
+
+        yield {'xref': xref, 'page': page.number, 'width': width, 'height': height}
+
+
+def iter_figures(doc, candidates):
+    """Lazily extract the image data of `candidates`, skipping byte-identical duplicates."""
+    seen_hashes = set()
+    for candidate in candidates:
+        base_image = doc.extract_image(candidate['xref'])
+        if not base_image:
+            continue
+
+        digest = hashlib.sha1(base_image["image"]).digest()
+        if digest in seen_hashes:
+            continue
+        seen_hashes.add(digest)
+
+        yield dict(candidate, ext=base_image["ext"], image=base_image["image"])
+
+
+def select_figures(doc, candidates, top_k=FIGURES_PER_PAPER):
+    """Materialize only the `top_k` largest figures, the ones the report can reference."""
+    ranked = sorted(candidates, key=lambda c: c['width'] * c['height'], reverse=True)
+    return list(itertools.islice(iter_figures(doc, ranked), top_k))
+
+
+def extract_with_pymupdf(pdf_path, top_k=FIGURES_PER_PAPER):
+    """
+    Single pass over the PDF with PyMuPDF: page text and figure candidates are collected in the same loop.
+
+    Returns a dict with the text, the selected figures and the time spent on each page (seconds).
+    """
+    text_parts = []
+    candidates = []
+    seen_xrefs = set()
+    page_timings = []
+
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            start = time.perf_counter()
+            text_parts.append(page.get_text())
+            text_parts.append("\n")
+            candidates.extend(iter_page_figures(doc, page, seen_xrefs))
+            page_timings.append(time.perf_counter() - start)
+
+        images = select_figures(doc, candidates, top_k)
+
+    return {
+        'backend': 'pymupdf',
+        'text': "".join(text_parts),
+        'images': images,
+        'page_timings': page_timings,
+    }
+
+
+def extract_images_from_pdf(pdf_path, top_k=FIGURES_PER_PAPER):
+    logger.info(f"Extracting images from {pdf_path}...")
+    seen_xrefs = set()
+    with fitz.open(pdf_path) as doc:
+        candidates = [candidate for page in doc for candidate in iter_page_figures(doc, page, seen_xrefs)]
+        images = select_figures(doc, candidates, top_k)
+    logger.info(f"Image extraction completed: kept {len(images)} of {len(candidates)} candidate figures.")
+    return images
+
+
+def extract_with_pypdf2(pdf_path):
+    """Original extraction path: PyPDF2 for the text, then a second PyMuPDF pass for the images."""
+    text_parts = []
+    page_timings = []
+    with open(pdf_path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        for page in reader.pages:
+            start = time.perf_counter()
+            text_parts.append(page.extract_text())
+            text_parts.append("\n")
+            page_timings.append(time.perf_counter() - start)
+
+    images = extract_images_from_pdf(pdf_path)
+
+    return {
+        'backend': 'pypdf2',
+        'text': "".join(text_parts),
+        'images': images,
+        'page_timings': page_timings,
+    }
+
+
+BACKENDS = {
+    'pymupdf': extract_with_pymupdf,
+    'pypdf2': extract_with_pypdf2,
+}
+
+
+def extract_pdf(pdf_path, backend=PDF_BACKEND):
+    """Extract text and images with `backend`, falling back to PyPDF2 if PyMuPDF fails."""
+    try:
+        result = BACKENDS[backend](pdf_path)
+    except Exception as e:
+        if backend == 'pypdf2':
+            raise
+        logger.warning(f"{backend} failed on {pdf_path} ({e}), falling back to pypdf2")
+        result = extract_with_pypdf2(pdf_path)
+
+    timings = result['page_timings']
+    logger.info(f"Extracted {len(timings)} pages with {result['backend']} in {sum(timings):.3f}s")
+    return result
+
+
+def iter_extract_pdfs(pdf_paths, max_workers=PDF_PARSE_WORKERS):
+    """
+    Yield `extract_pdf` results for `pdf_paths`, in order.
+
+    With more than one worker, the next PDFs are parsed in a process pool while the caller is
+    still busy with the current result (e.g. summarizing it). On single-vCPU hosts, or where
+    worker processes can't be started (some serverless sandboxes), parsing runs in-process.
+    """
+    pdf_paths = list(pdf_paths)
+    if max_workers <= 1 or len(pdf_paths) <= 1:
+        for path in pdf_paths:
+            yield extract_pdf(path)
+        return
+
+    try:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+    except (OSError, NotImplementedError) as e:
+        logger.warning(f"Process pool unavailable ({e}), parsing PDFs in-process")
+        for path in pdf_paths:
+            yield extract_pdf(path)
+        return
+
+    with executor:
+        paths = iter(pdf_paths)
+        futures = deque(executor.submit(extract_pdf, path) for path in itertools.islice(paths, max_workers))
+        while futures:
+            future = futures.popleft()
+            # Keep the pool busy while the caller works on this result
+            for path in itertools.islice(paths, 1):
+                futures.append(executor.submit(extract_pdf, path))
+            yield future.result()
+
+
+if __name__ == '__main__':
+    # Compare both backends on a corpus: python -m utils.pdf paper1.pdf paper2.pdf ...
+    for path in sys.argv[1:]:
+        for name, extract in BACKENDS.items():
+            timings = extract(path)['page_timings']
+            total = sum(timings)
+            slowest = max(timings, default=0.0)
+            print(f"{path}\t{name}\tpages={len(timings)}\ttotal={total:.3f}s\tslowest_page={slowest:.3f}s")
@@ -0,0 +1,65 @@
+import math
+import os
+import re
+from collections import Counter
+
+# Free-text description of what the reader cares about, e.g. "LLM agents, tool use, planning".
+# Empty disables the relevance filter.
+INTEREST_PROFILE = os.getenv('INTEREST_PROFILE', '')
+# Papers passed on to download and summarization per run
+RELEVANCE_TOP_K = int(os.getenv('RELEVANCE_TOP_K', 5))
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in into is it its of on or our that the their this
+to we with via using based new show paper propose proposed approach method methods results
+""".split())
+
+
+def tokenize(text):
+    return [token for token in re.findall(r'[a-z0-9]+', text.lower()) if token not in STOPWORDS]
+
+
+def bm25_scores(query, documents, k1=1.5, b=0.75):
+    """
+    Okapi BM25 score of every document (a str) against `query`.
+    Document frequencies are taken from `documents` themselves.
+    """
+    docs = [Counter(tokenize(document)) for document in documents]
+    if not docs:
+        return []
+
+    avg_len = sum(sum(doc.values()) for doc in docs) / len(docs) or 1.0
+    doc_freq = Counter(term for doc in docs for term in doc)
+    query_terms = set(tokenize(query))
+
+    scores = []
+    for doc in docs:
+        doc_len = sum(doc.values())
+        score = 0.0
+        for term in query_terms:
+            tf = doc.get(term, 0)
+            if not tf:
+                continue
+            idf = math.log(1 + (len(docs) - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len / avg_len))
+        scores.append(score)
+    return scores
+
+
+def rank_papers(entries, profile=INTEREST_PROFILE, top_k=RELEVANCE_TOP_K):
+    """
+    Keep the `top_k` entries whose title and abstract best match the interest `profile`.
+
+    Entries keep their original order and get a `relevance` score. Without a profile
+    every entry is returned unchanged.
+    """
+    entries = list(entries)
+    if not profile.strip():
+        return entries
+
+    documents = [f"{entry['title']} {entry.get('abstract', '')}" for entry in entries]
+    scores = bm25_scores(profile, documents)
+
+    ranked = sorted(range(len(entries)), key=lambda i: scores[i], reverse=True)
+    keep = sorted(i for i in ranked[:top_k] if scores[i] > 0)
+    return [dict(entries[i], relevance=scores[i]) for i in keep]
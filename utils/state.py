@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+
+import urllib3
+
+
+class StateStore:
+    """
+    Small JSON key/value store persisted to a single file.
+
+    Every `set` rewrites the file atomically, so a crash never leaves a half-written state behind.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None
+        self._mtime = None
+
+    def _load(self):
+        # Reload when another process (e.g. the job worker) has rewritten the file
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if self._data is None or mtime != self._mtime:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except FileNotFoundError:
+                self._data = {}
+            self._mtime = mtime
+        return self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._load().get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            data = self._load()
+            data[key] = value
+            self._flush(data)
+
+    def delete(self, key):
+        with self._lock:
+            data = self._load()
+            if data.pop(key, None) is not None:
+                self._flush(data)
+
+    def _flush(self, data):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+
+class KVStateStore:
+    """
+    The same key/value interface on a Redis REST API (Upstash, Vercel KV), for state that
+    every serverless function instance must see. Values are stored as JSON under `prefix`.
+    """
+
+    def __init__(self, url, token, prefix='arxiv_sentinel:', timeout=10):
+        self.url = url.rstrip('/')
+        self.token = token
+        self.prefix = prefix
+        self.timeout = timeout
+        self._http = urllib3.PoolManager()
+
+    def _command(self, *args):
+        response = self._http.request(
+            'POST', self.url, body=json.dumps(args).encode('utf-8'), timeout=self.timeout,
+            headers={'Authorization': f"Bearer {self.token}", 'Content-Type': 'application/json'})
+        try:
+            payload = json.loads(response.data or b'{}')
+        except ValueError:
+            payload = {}
+        if response.status != 200 or 'error' in payload:
+            raise Exception(f"KV {args[0]} failed: {payload.get('error', f'status code {response.status}')}")
+        return payload.get('result')
+
+    def get(self, key, default=None):
+        value = self._command('GET', self.prefix + key)
+        return default if value is None else json.loads(value)
+
+    def set(self, key, value):
+        self._command('SET', self.prefix + key, json.dumps(value))
+
+    def delete(self, key):
+        self._command('DEL', self.prefix + key)
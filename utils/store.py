@@ -0,0 +1,252 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils.dedup import base_id, lsh_buckets, pack_signature, unpack_signature, similarity
+
+
+def next_day(date):
+    """The day after `date` if it is a date-only ISO string ('2024-01-31'), else None."""
+    try:
+        return (datetime.date.fromisoformat(date) + datetime.timedelta(days=1)).isoformat()
+    except ValueError:
+        return None
+
+
+class PaperStore:
+    """
+    Local archive of processed papers: metadata, extracted text and summaries in SQLite,
+    with an FTS5 full-text index over title, abstract, text and summaries, and MinHash
+    signatures with LSH buckets for finding near-duplicates (see utils.dedup).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS papers (
+                    id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    abstract TEXT,
+                    authors TEXT,
+                    categories TEXT,
+                    topic TEXT,
+                    published TEXT,
+                    updated TEXT,
+                    pdf_link TEXT,
+                    text TEXT,
+                    stored_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS papers_topic_published ON papers (topic, published);
+                CREATE INDEX IF NOT EXISTS papers_published ON papers (published);
+
+                -- Every topic a paper was stored under; papers.topic only holds the first topic of its last write
+                CREATE TABLE IF NOT EXISTS paper_topics (
+                    paper_id TEXT NOT NULL REFERENCES papers (id) ON DELETE CASCADE,
+                    topic TEXT NOT NULL,
+                    PRIMARY KEY (topic, paper_id)
+                );
+                INSERT OR IGNORE INTO paper_topics (paper_id, topic)
+                    SELECT id, topic FROM papers WHERE topic IS NOT NULL;
+
+                CREATE TABLE IF NOT EXISTS summaries (
+                    paper_id TEXT NOT NULL REFERENCES papers (id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    title TEXT,
+                    summary TEXT,
+                    PRIMARY KEY (paper_id, position)
+                );
+
+                CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5 (
+                    id UNINDEXED, title, abstract, text, summaries
+                );
+
+                CREATE TABLE IF NOT EXISTS signatures (
+                    paper_id TEXT NOT NULL REFERENCES papers (id) ON DELETE CASCADE,
+                    kind TEXT NOT NULL,
+                    signature BLOB NOT NULL,
+                    PRIMARY KEY (paper_id, kind)
+                );
+
+                CREATE TABLE IF NOT EXISTS lsh_buckets (
+                    kind TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    paper_id TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS lsh_buckets_lookup ON lsh_buckets (kind, bucket);
+                CREATE INDEX IF NOT EXISTS lsh_buckets_paper ON lsh_buckets (paper_id);
+            """)
+        return self._conn
+
+    def add_papers(self, papers):
+        """
+        Insert or replace `papers` in a single transaction.
+
+        Each paper is a dict with at least `id` and `title`, and optionally `abstract`, `authors`,
+        `categories`, `topics` (or a single `topic`), `published`, `updated`, `pdf_link`, `text`,
+        `summaries` (a list of {'title', 'summary'}) and `signatures` ({kind: MinHash signature},
+        e.g. 'abstract' and 'text'). Topics add to those already stored for the paper.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                for paper in papers:
+                    self._write_paper(conn, paper, now)
+
+    def _write_paper(self, conn, paper, now):
+        paper_id = paper['id']
+        summaries = paper.get('summaries', [])
+        topics = paper.get('topics') or ([paper['topic']] if paper.get('topic') else [])
+
+        conn.execute(
+            "INSERT OR REPLACE INTO papers (id, title, abstract, authors, categories, topic, published, updated, "
+            "pdf_link, text, stored_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (paper_id, paper['title'], paper.get('abstract'), json.dumps(paper.get('authors', [])),
+             json.dumps(paper.get('categories', [])), topics[0] if topics else None, paper.get('published'),
+             paper.get('updated'), paper.get('pdf_link'), paper.get('text'), now))
+        conn.executemany(
+            "INSERT OR IGNORE INTO paper_topics (paper_id, topic) VALUES (?, ?)",
+            [(paper_id, topic) for topic in topics])
+
+        conn.execute("DELETE FROM summaries WHERE paper_id = ?", (paper_id,))
+        conn.executemany(
+            "INSERT INTO summaries (paper_id, position, title, summary) VALUES (?, ?, ?, ?)",
+            [(paper_id, i, s['title'], s['summary']) for i, s in enumerate(summaries)])
+
+        conn.execute("DELETE FROM papers_fts WHERE id = ?", (paper_id,))
+        conn.execute(
+            "INSERT INTO papers_fts (id, title, abstract, text, summaries) VALUES (?, ?, ?, ?, ?)",
+            (paper_id, paper['title'], paper.get('abstract') or "", paper.get('text') or "",
+             "\n\n".join(s['summary'] for s in summaries)))
+
+        signatures = {kind: signature for kind, signature in paper.get('signatures', {}).items() if signature}
+        conn.execute("DELETE FROM signatures WHERE paper_id = ?", (paper_id,))
+        conn.execute("DELETE FROM lsh_buckets WHERE paper_id = ?", (paper_id,))
+        conn.executemany(
+            "INSERT INTO signatures (paper_id, kind, signature) VALUES (?, ?, ?)",
+            [(paper_id, kind, pack_signature(signature)) for kind, signature in signatures.items()])
+        conn.executemany(
+            "INSERT INTO lsh_buckets (kind, bucket, paper_id) VALUES (?, ?, ?)",
+            [(kind, bucket, paper_id) for kind, signature in signatures.items() for bucket in lsh_buckets(signature)])
+
+    def get(self, paper_id, with_text=True):
+        papers = self._fetch_papers("SELECT * FROM papers WHERE id = ?", (paper_id,), with_text)
+        return papers[0] if papers else None
+
+    def query(self, topic=None, since=None, until=None, keyword=None, limit=50, with_text=False, fts_syntax=False):
+        """
+        Find stored papers by topic, `published` date range (ISO strings, inclusive; a date-only
+        `until` like '2024-01-31' covers that whole day) and keywords.
+        Keyword matches are ordered by relevance, everything else newest first.
+
+        Each word of `keyword` must occur, as written (e.g. 'GPT-4', 'c++'). With `fts_syntax`,
+        `keyword` is passed on as an FTS5 query (AND, OR, NEAR, prefix*, ...); a malformed one
+        raises ValueError.
+        """
+        clauses = []
+        params = []
+        if topic is not None:
+            clauses.append("p.id IN (SELECT paper_id FROM paper_topics WHERE topic = ?)")
+            params.append(topic)
+        if since is not None:
+            clauses.append("p.published >= ?")
+            params.append(since)
+        if until is not None:
+            # `published` is a timestamp, so '2024-01-31T09:00:00Z' > '2024-01-31'
+            day_after = next_day(until)
+            if day_after:
+                clauses.append("p.published < ?")
+                params.append(day_after)
+            else:
+                clauses.append("p.published <= ?")
+                params.append(until)
+
+        if keyword:
+            if not fts_syntax:
+                keyword = " ".join('"' + word.replace('"', '""') + '"' for word in keyword.split())
+            sql = "SELECT p.* FROM papers_fts f JOIN papers p ON p.id = f.id WHERE papers_fts MATCH ?"
+            params.insert(0, keyword)
+            order = "f.rank"
+        else:
+            sql = "SELECT p.* FROM papers p WHERE 1 = 1"
+            order = "p.published DESC"
+
+        for clause in clauses:
+            sql += f" AND {clause}"
+        sql += f" ORDER BY {order} LIMIT ?"
+        params.append(limit)
+
+        try:
+            return self._fetch_papers(sql, params, with_text)
+        except sqlite3.OperationalError as e:
+            if keyword and fts_syntax:
+                raise ValueError(f"Bad keyword query {keyword!r}: {e}") from e
+            raise
+
+    def find_near_duplicates(self, kind, signature, threshold, exclude=None):
+        """
+        Stored papers whose `kind` signature shares an LSH bucket with `signature` and whose estimated
+        similarity is at least `threshold`, as (paper_id, similarity), most similar first.
+        """
+        buckets = lsh_buckets(signature)
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT s.paper_id, s.signature FROM signatures s WHERE s.kind = ? AND s.paper_id IN ("
+                f"SELECT paper_id FROM lsh_buckets WHERE kind = ? AND bucket IN ({', '.join('?' * len(buckets))}))",
+                [kind, kind] + buckets).fetchall()
+
+        matches = [(paper_id, similarity(signature, unpack_signature(blob))) for paper_id, blob in rows
+                   if paper_id != exclude]
+        return sorted([match for match in matches if match[1] >= threshold], key=lambda match: -match[1])
+
+    def get_versions(self, paper_id):
+        """Ids of the stored versions of the arXiv paper `paper_id` (with or without version), newest first."""
+        base = base_id(paper_id)
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute("SELECT id FROM papers WHERE id = ? OR id LIKE ?", (base, f"{base}v%")).fetchall()
+        ids = [row[0] for row in rows if base_id(row[0]) == base]
+
+        def version(pid):
+            suffix = pid[len(base) + 1:]
+            return int(suffix) if suffix.isdigit() else 0
+        return sorted(ids, key=version, reverse=True)
+
+    def _fetch_papers(self, sql, params, with_text):
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(sql, params).fetchall()
+
+            papers = []
+            for row in rows:
+                paper = dict(row)
+                paper['authors'] = json.loads(paper['authors'] or '[]')
+                paper['categories'] = json.loads(paper['categories'] or '[]')
+                paper['topics'] = [row[0] for row in conn.execute(
+                    "SELECT topic FROM paper_topics WHERE paper_id = ? ORDER BY rowid", (paper['id'],))]
+                if not with_text:
+                    paper.pop('text')
+                paper['summaries'] = [
+                    {'title': title, 'summary': summary} for title, summary in conn.execute(
+                        "SELECT title, summary FROM summaries WHERE paper_id = ? ORDER BY position", (paper['id'],))
+                ]
+                papers.append(paper)
+            return papers
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
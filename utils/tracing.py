@@ -0,0 +1,126 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+# Individual LLM calls kept in a run summary; totals are always complete
+MAX_RECORDED_CALLS = 1000
+
+
+class Span:
+    """Counters (bytes, items, tokens, ...) attached to one traced block."""
+
+    def __init__(self):
+        self.counters = {}
+
+    def add(self, **counters):
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+class Tracer:
+    """
+    Collects wall time and counters per pipeline stage, plus every LLM call, for one run.
+
+    Stages are aggregated: calls, total/max seconds and the sum of each counter.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.stages = {}
+            self.llm_calls = []
+
+    def record(self, stage, seconds, **counters):
+        with self._lock:
+            stats = self.stages.setdefault(stage, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'counters': {}})
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            for name, value in counters.items():
+                stats['counters'][name] = stats['counters'].get(name, 0) + value
+
+    def record_llm_call(self, model, seconds, prompt_tokens=0, completion_tokens=0, error=None):
+        self.record('llm', seconds, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                    errors=1 if error else 0)
+        with self._lock:
+            if len(self.llm_calls) < MAX_RECORDED_CALLS:
+                self.llm_calls.append({
+                    'model': model,
+                    'seconds': round(seconds, 3),
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'error': error,
+                })
+
+    @contextlib.contextmanager
+    def span(self, stage, **counters):
+        """Time the block as one call of `stage`; counters can be added through the yielded Span."""
+        span = Span()
+        span.add(**counters)
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            self.record(stage, time.perf_counter() - start, **span.counters)
+
+    def traced(self, stage):
+        """Decorator form of `span`."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self):
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'wall_seconds': round(time.time() - self.started_at, 3),
+                'stages': {
+                    stage: dict(stats, seconds=round(stats['seconds'], 3), max_seconds=round(stats['max_seconds'], 3))
+                    for stage, stats in self.stages.items()
+                },
+                'llm_calls': list(self.llm_calls),
+            }
+
+    def write_json(self, path, **extra):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(dict(self.summary(), **extra), f, indent=2)
+
+    def to_prometheus(self, prefix='arxiv_sentinel'):
+        """The stage totals in the Prometheus text exposition format."""
+        summary = self.summary()
+        lines = [
+            f"# TYPE {prefix}_stage_seconds_total counter",
+            *(f'{prefix}_stage_seconds_total{{stage="{stage}"}} {stats["seconds"]}'
+              for stage, stats in summary['stages'].items()),
+            f"# TYPE {prefix}_stage_calls_total counter",
+            *(f'{prefix}_stage_calls_total{{stage="{stage}"}} {stats["calls"]}'
+              for stage, stats in summary['stages'].items()),
+        ]
+
+        counter_names = sorted({name for stats in summary['stages'].values() for name in stats['counters']})
+        for name in counter_names:
+            lines.append(f"# TYPE {prefix}_stage_{name}_total counter")
+            for stage, stats in summary['stages'].items():
+                if name in stats['counters']:
+                    lines.append(f'{prefix}_stage_{name}_total{{stage="{stage}"}} {stats["counters"][name]}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+
+
+tracer = Tracer()
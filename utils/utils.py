@@ -1,50 +1,207 @@
+import contextlib
+import hashlib
+import io
+import json
 import os
 from email import encoders
 from email.mime.base import MIMEBase
 
 import urllib3
 import urllib.parse
-import fitz
-import smtplib
 import logging
 import re
-import PyPDF2
-import openai
+import shutil
+import uuid
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
 from xml.etree import ElementTree as ET
-from utils.llm import invoke_llm
+from utils.llm import LLM_MODEL, LLM_CHEAP_MODEL
+from utils.backends import get_backend
+from utils.cache import SummaryCache
+from utils.state import StateStore, KVStateStore
+from utils.pdf import extract_pdf, iter_extract_pdfs
+from utils.chunker import chunk_text, count_tokens, truncate_tokens, CHUNK_TARGET_TOKENS, CHUNK_OVERLAP_TOKENS
+from utils.ranking import rank_papers, INTEREST_PROFILE
+from utils.store import PaperStore
+from utils.dedup import minhash, DEDUP_THRESHOLD
+from utils.mailer import SMTPMailer
 from utils.calendar import create_ics_file, estimate_reading_time
+from utils.image import make_thumbnails, THUMBNAIL_FORMAT
+from utils.tracing import tracer
+
+# Concurrent PDF transfers; the connection pool is sized to match so no connection is thrown away
+PDF_DOWNLOAD_WORKERS = int(os.getenv('PDF_DOWNLOAD_WORKERS', 8))
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Seconds to connect, and to wait for each read, on arXiv requests
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 10))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 30))
 
-http = urllib3.PoolManager(cert_reqs='CERT_NONE')
+http = urllib3.PoolManager(cert_reqs='CERT_NONE', maxsize=PDF_DOWNLOAD_WORKERS,
+                           timeout=urllib3.Timeout(connect=HTTP_CONNECT_TIMEOUT, read=HTTP_READ_TIMEOUT))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-openai.api_key = os.getenv('OPENAI_API_KEY')
-
-client = openai.OpenAI(
-    api_key=openai.api_key,
-)
-
 PAPER_TOPIC  = os.getenv('PAPER_TOPIC')
 
 SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 587
+SMTP_MAX_RETRIES = int(os.getenv('SMTP_MAX_RETRIES', 3))
+SMTP_RETRY_BACKOFF = float(os.getenv('SMTP_RETRY_BACKOFF', 1.0))
 
 EMAIL_ADDRESS = os.getenv('EMAIL_ADDRESS')
 EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')
 
 TARGET_ADDRESS = os.getenv('TARGET_ADDRESS')
 
+# Many topics x many recipients, see load_subscriptions; overrides PAPER_TOPIC / TARGET_ADDRESS
+SUBSCRIPTIONS = os.getenv('SUBSCRIPTIONS')
+SUBSCRIPTIONS_FILE = os.getenv('SUBSCRIPTIONS_FILE')
+
 PAPER_DIR = '/tmp/papers'
 
+ARXIV_API_URL = "https://export.arxiv.org/api/query"
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+
+# 'incremental' processes every paper newer than the persisted high-water mark,
+# 'latest' only the single newest submission
+ARXIV_FETCH_MODE = os.getenv('ARXIV_FETCH_MODE', 'incremental')
+ARXIV_PAGE_SIZE = int(os.getenv('ARXIV_PAGE_SIZE', 50))
+ARXIV_MAX_PAGES = int(os.getenv('ARXIV_MAX_PAGES', 10))
+ARXIV_MAX_PAPERS = int(os.getenv('ARXIV_MAX_PAPERS', 20))
+# arXiv asks API clients to wait 3 seconds between consecutive calls
+ARXIV_PAGE_DELAY = 3
+
+# Local state (e.g. the arXiv high-water mark) that must survive between runs
+STATE_DIR = os.getenv('STATE_DIR', '/tmp/arxiv_sentinel_state')
+
+# State that must survive between runs (the job checkpoint, the arXiv high-water marks). Serverless
+# function instances don't share /tmp, so on Vercel it must go to a Redis REST API (e.g. Vercel KV)
+# that every instance can reach
+STATE_KV_URL = os.getenv('STATE_KV_URL', os.getenv('KV_REST_API_URL'))
+STATE_KV_TOKEN = os.getenv('STATE_KV_TOKEN', os.getenv('KV_REST_API_TOKEN'))
+
+state_store = (KVStateStore(STATE_KV_URL, STATE_KV_TOKEN) if STATE_KV_URL
+               else StateStore(os.path.join(STATE_DIR, 'state.json')))
+
+# Statuses of recent jobs, read by the status endpoint; shared the same way
+JOB_STATUS_KV_URL = os.getenv('JOB_STATUS_KV_URL', STATE_KV_URL)
+JOB_STATUS_KV_TOKEN = os.getenv('JOB_STATUS_KV_TOKEN', STATE_KV_TOKEN)
+
+status_store = KVStateStore(JOB_STATUS_KV_URL, JOB_STATUS_KV_TOKEN) if JOB_STATUS_KV_URL else state_store
+
+# Archive of processed papers (metadata, text, summaries) with a full-text index
+PAPER_STORE_PATH = os.getenv('PAPER_STORE_PATH', os.path.join(STATE_DIR, 'papers.sqlite3'))
+
+paper_store = PaperStore(PAPER_STORE_PATH)
+
+# Checkpointed job state: the job record lives in state_store, downloads, extracted text and figures
+# in PAPER_DIR and JOB_DIR. A job resumed on an instance without those files redoes them, see restore_job_files
+JOB_DIR = os.path.join(STATE_DIR, 'job')
+# Seconds one invocation may spend before checkpointing and returning (vercel maxDuration is 60)
+JOB_TIME_BUDGET = float(os.getenv('JOB_TIME_BUDGET', 50))
+# No new step (download batch, extraction, summary, digest) starts with less time than this left
+JOB_STEP_RESERVE = float(os.getenv('JOB_STEP_RESERVE', 10))
+# Attempts at a paper, and failed runs of a job in a row, before it is given up on
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+# Finished jobs whose status is kept for the status endpoint
+JOB_HISTORY_SIZE = 20
+
+# Max number of chunk summaries in flight at once, and per-request timeout (seconds)
+SUMMARY_MAX_WORKERS = int(os.getenv('SUMMARY_MAX_WORKERS', 8))
+SUMMARY_TIMEOUT = float(os.getenv('SUMMARY_TIMEOUT', 45))
+SUMMARY_MAX_TOKENS = 3000
+# LLM backend of the summaries, see utils.backends; e.g. 'local' for a pool of local inference servers
+SUMMARY_BACKEND = os.getenv('SUMMARY_BACKEND', 'openai')
+
+SUMMARY_PROMPT = """
+This is a chapter of the paper. Please summarize the content from the following aspects:
+1. What was done
+2. The process
+3. What was the result
+
+{content}"""
+
+ABSTRACT_PROMPT = """
+This is the abstract of a paper. Please summarize it in a few sentences from the following aspects:
+1. What was done
+2. The process
+3. What was the result
+
+{content}"""
+
+PAPER_PROMPT = """
+This is the full text of a paper. Please summarize the content from the following aspects:
+1. What was done
+2. The process
+3. What was the result
+
+{content}"""
+
+REDUCE_PROMPT = """
+These are summaries of the chapters of one paper. Please combine them into a single summary of the paper from the following aspects:
+1. What was done
+2. The process
+3. What was the result
+
+{content}"""
+
+CHANGES_PROMPT = """
+These are two versions of the abstract of a paper, the earlier one first, separated by "----". Please describe in a few sentences what changed in the later version.
+
+{content}"""
+
+# 'auto' picks 'abstract', 'whole' or 'map_reduce' per paper from its token count
+SUMMARY_STRATEGY = os.getenv('SUMMARY_STRATEGY', 'auto')
+# Papers up to this many tokens are summarized in one call, if they fit the summary backend's context window
+WHOLE_PAPER_MAX_TOKENS = int(os.getenv('WHOLE_PAPER_MAX_TOKENS', 24000))
+# Room for the prompt template around the content of a summary request, in tokens
+SUMMARY_PROMPT_TOKENS = 200
+
+# Persistent summary cache, so re-processed papers don't pay for the same LLM calls again
+SUMMARY_CACHE_DIR = os.getenv('SUMMARY_CACHE_DIR', '/tmp/arxiv_sentinel_cache')
+SUMMARY_CACHE_TTL = int(os.getenv('SUMMARY_CACHE_TTL', 7 * 24 * 3600))
+SUMMARY_CACHE_MAX_BYTES = int(os.getenv('SUMMARY_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+summary_cache = SummaryCache(SUMMARY_CACHE_DIR, ttl=SUMMARY_CACHE_TTL, max_bytes=SUMMARY_CACHE_MAX_BYTES)
+
+# Upper bound on the inline figures of one email, however many papers it covers
+EMAIL_IMAGES_MAX_BYTES = int(os.getenv('EMAIL_IMAGES_MAX_BYTES', 2 * 1024 * 1024))
+
+# Per-run latency report (JSON, one file per run) and optional Prometheus text file of the same totals
+TRACE_DIR = os.getenv('TRACE_DIR', os.path.join(STATE_DIR, 'traces'))
+TRACE_PROMETHEUS_PATH = os.getenv('TRACE_PROMETHEUS_PATH')
+
+def open_arxiv_stream(params):
+    """Send an arXiv API query and return the undecoded response stream of the Atom feed."""
+    encoded_params = urllib.parse.urlencode(params)
+
+    response = http.request("GET", f"{ARXIV_API_URL}?{encoded_params}", preload_content=False)
+    if response.status != 200:
+        response.release_conn()
+        raise Exception(f"Failed to fetch papers: Status code {response.status}")
+
+    return response
+
+
+def iter_arxiv_entries(params):
+    """Yield paper records of an arXiv API query while the feed is still arriving."""
+    response = open_arxiv_stream(params)
+    try:
+        yield from iter_entries(response)
+    finally:
+        response.drain_conn()
+        response.release_conn()
+
+
 def fetch_today_papers(topic=PAPER_TOPIC):
     logger.info("Fetching today's papers from arXiv...")
-    url = "https://export.arxiv.org/api/query"
     # today = datetime.today().strftime('%Y%m%d')
     params = {
         "search_query": f"cat:{topic}",
@@ -52,119 +209,475 @@ def fetch_today_papers(topic=PAPER_TOPIC):
         "max_results": 1
     }
 
-    # encoded_params = urllib3.request.urlencode(params)
-    encoded_params = urllib.parse.urlencode(params)
+    response = open_arxiv_stream(params)
+    logger.info("Fetched papers successfully.")
+    return response
 
-    response = http.request("GET", f"{url}?{encoded_params}")
-    if response.status != 200:
-        raise Exception(f"Failed to fetch papers: Status code {response.status}")
 
-    logger.info("Fetched papers successfully.")
-    return response.data.decode('utf-8')
+def high_water_mark_key(topic):
+    return f"high_water_mark:{topic}"
 
 
-def parse_and_download_papers(xml_data):
-    logger.info("Parsing XML data and downloading papers...")
-    root = ET.fromstring(xml_data)
-    entries = root.findall("{http://www.w3.org/2005/Atom}entry")
+def fetch_new_papers(topic=PAPER_TOPIC, page_size=ARXIV_PAGE_SIZE, max_papers=ARXIV_MAX_PAPERS,
+                     deadline=None, progress=None):
+    """
+    Page through the newest submissions of `topic` until the persisted high-water mark is reached.
+
+    The mark is the newest `published` timestamp already processed plus the ids seen at that
+    timestamp. Returns unseen entries, newest first, capped at `max_papers` (the oldest ones are
+    kept, so the next run picks up the rest; None returns all of them, e.g. for ranking).
+    Call `commit_high_water_mark` once they are processed.
+
+    No page is requested once `deadline` has less than JOB_STEP_RESERVE left; None is returned
+    then, and `progress` (a dict the caller persists) holds the pages fetched so far. Calling
+    again with it continues the paging.
+    """
+    logger.info(f"Fetching new papers from arXiv for {topic}...")
+    mark = state_store.get(high_water_mark_key(topic))
+
+    progress = {} if progress is None else progress
+    progress.setdefault('start', 0)
+    progress.setdefault('pages', 0)
+    new_entries = progress.setdefault('entries', [])
+    seen = {entry['id'] for entry in new_entries}
+
+    paged = False
+    while progress['pages'] < ARXIV_MAX_PAGES:
+        if deadline is not None and deadline.expired(JOB_STEP_RESERVE):
+            logger.info(f"{topic}: time budget used up after {progress['pages']} pages, the fetch continues next run")
+            return None
+        if paged:
+            time.sleep(ARXIV_PAGE_DELAY)
+        paged = True
+
+        params = {
+            "search_query": f"cat:{topic}",
+            "sortBy": "submittedDate",
+            "sortOrder": "descending",
+            "start": progress['start'],
+            "max_results": page_size
+        }
+        page_len = 0
+        reached_mark = False
+        for entry in iter_arxiv_entries(params):
+            page_len += 1
+            if mark is not None:
+                if entry['published'] < mark['published']:
+                    reached_mark = True
+                    break
+                if entry['published'] == mark['published'] and entry['id'] in mark['ids']:
+                    continue
+            # Papers submitted since an interrupted fetch shift the pages, so some come round again
+            if entry['id'] in seen:
+                continue
+            seen.add(entry['id'])
+            new_entries.append(entry)
+        progress['pages'] += 1
+
+        # Without a mark there is nothing to catch up on, the first page is enough
+        if reached_mark or mark is None or page_len < page_size:
+            break
+        progress['start'] += page_size
+    else:
+        if mark is not None:
+            logger.warning(f"{topic}: the high-water mark is more than {ARXIV_MAX_PAGES * page_size} papers back; "
+                           f"unseen papers older than that are skipped")
+
+    found = len(new_entries)
+    if max_papers is not None:
+        new_entries = new_entries[:max_papers] if mark is None else new_entries[-max_papers:]
+
+    logger.info(f"Found {found} new papers.")
+    if found > len(new_entries):
+        if mark is None:
+            # The first run starts from the newest papers; the mark it leaves means older ones are never fetched
+            logger.warning(f"{topic}: first run, processing the newest {len(new_entries)} of {found} papers "
+                           f"(ARXIV_MAX_PAPERS); the {found - len(new_entries)} older ones are skipped")
+        else:
+            logger.warning(f"{topic}: processing {len(new_entries)} of {found} new papers (ARXIV_MAX_PAPERS); "
+                           f"{found - len(new_entries)} newer ones are deferred to the next run")
+    return new_entries
+
+
+def commit_high_water_mark(topic, entries):
+    """Advance the high-water mark of `topic` past `entries` once they have been processed."""
+    if not entries:
+        return
+
+    newest = max(entry['published'] for entry in entries)
+    ids = {entry['id'] for entry in entries if entry['published'] == newest}
+
+    key = high_water_mark_key(topic)
+    mark = state_store.get(key)
+    if mark is not None:
+        if mark['published'] > newest:
+            return
+        if mark['published'] == newest:
+            ids |= set(mark['ids'])
+
+    state_store.set(key, {'published': newest, 'ids': sorted(ids)})
+    logger.info(f"High-water mark for {topic} advanced to {newest}")
+
+
+def parse_entry(entry):
+    """Convert an Atom <entry> element into a paper record."""
+    abs_url = entry.findtext(f"{ATOM_NS}id").strip()
+    pdf_link = None
+    for link in entry.findall(f"{ATOM_NS}link"):
+        if link.attrib.get('title') == 'pdf':
+            pdf_link = link.attrib['href']
+            break
+
+    return {
+        'id': abs_url.rsplit('/abs/', 1)[-1],
+        'title': entry.findtext(f"{ATOM_NS}title").strip(),
+        'abstract': (entry.findtext(f"{ATOM_NS}summary") or "").strip(),
+        'authors': [author.findtext(f"{ATOM_NS}name", "").strip() for author in entry.findall(f"{ATOM_NS}author")],
+        'categories': [category.attrib['term'] for category in entry.findall(f"{ATOM_NS}category")],
+        'published': entry.findtext(f"{ATOM_NS}published").strip(),
+        'updated': entry.findtext(f"{ATOM_NS}updated").strip(),
+        'pdf_link': pdf_link,
+    }
+
+
+def iter_entries(source):
+    """
+    Incrementally parse an arXiv Atom feed, yielding one paper record per <entry>.
+
+    `source` is a file-like object (e.g. an HTTP response stream), or the feed as str/bytes.
+    Parsed entries are cleared from the tree, so memory stays flat however long the feed is.
+    """
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    root = None
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            continue
+
+        if elem.tag == f"{ATOM_NS}entry":
+            with tracer.span('parse', entries=1):
+                record = parse_entry(elem)
+            yield record
+            root.clear()
+
+
+def download_papers(entries, max_workers=PDF_DOWNLOAD_WORKERS, deadline=None):
+    """
+    Download the PDFs of `entries` with up to `max_workers` concurrent transfers.
+
+    `entries` may be a generator (e.g. `iter_entries`); downloads start as entries arrive.
+    Duplicate PDF links are fetched once. Papers that fail to download, or are still
+    downloading when `deadline` expires, are logged and skipped.
+    """
+    logger.info("Downloading papers...")
+
+    def sanitized_filename(t):
+        return re.sub(r'[\\/*?\"<>|]', '', t)
+
+    os.makedirs(PAPER_DIR, exist_ok=True)
+
+    seen_links = set()
+    jobs = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for entry in entries:
+            pdf_link = entry['pdf_link']
+            if not pdf_link or pdf_link in seen_links:
+                continue
+            seen_links.add(pdf_link)
+
+            filename = os.path.join(PAPER_DIR, f"{sanitized_filename(entry['title'])}.pdf")
+            jobs.append((entry, filename, executor.submit(download_pdf, pdf_link, filename, deadline=deadline)))
+
     papers = []
-    for entry in entries:
-        title = entry.find("{http://www.w3.org/2005/Atom}title").text.strip()
-        pdf_link = None
-        for link in entry.findall("{http://www.w3.org/2005/Atom}link"):
-            if link.attrib.get('title') == 'pdf':
-                pdf_link = link.attrib['href']
-                break
-        if pdf_link:
-            def sanitized_filename(t):
-                return re.sub(r'[\\/*?\"<>|]', '', t)
-
-            filename = os.path.join(PAPER_DIR, f"{sanitized_filename(title)}.pdf")
-            os.makedirs(os.path.dirname(filename), exist_ok=True)
-            download_pdf(pdf_link, filename)
-            papers.append({'title': title, 'filename': filename})
-            logger.info(f"Downloaded paper: {title}")
+    for entry, filename, future in jobs:
+        try:
+            future.result()
+        except Exception as e:
+            logger.error(f"Failed to download paper {entry['title']}: {e}")
+            continue
+        papers.append(dict(entry, filename=filename))
+        logger.info(f"Downloaded paper: {entry['title']}")
     return papers
 
 
-def download_pdf(url, filename):
-    """Download PDF file"""
-    response = http.request("GET", url)
-    if response.status != 200:
-        raise Exception(f"Failed to download PDF: Status code {response.status}")
+def parse_and_download_papers(source):
+    logger.info("Parsing XML data and downloading papers...")
+    return download_papers(iter_entries(source))
 
-    with open(filename, 'wb') as f:
-        f.write(response.data)
-    logger.info(f"Downloaded: {filename}")
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_downloaded(filename):
+    """A download is complete once the file matches the checksum recorded in its `.sha256` sidecar."""
+    checksum_path = f"{filename}.sha256"
+    if not (os.path.exists(filename) and os.path.exists(checksum_path)):
+        return False
+
+    with open(checksum_path, 'r') as f:
+        return f.read().strip() == file_sha256(filename)
 
 
-def extract_images_from_pdf(pdf_path):
-    logger.info(f"Extracting images from {pdf_path}...")
-    images = []
-    doc = fitz.open(pdf_path)
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        image_list = page.get_images(full=True)
-        for img_index, img in enumerate(image_list):
-            xref = img[0]
-            base_image = doc.extract_image(xref)
-            image_bytes = base_image["image"]
-            images.append(image_bytes)
-            logger.info(f"Extracted image {img_index} from page {page_num}")
-    doc.close()
-    logger.info("Image extraction completed.")
-    return images
+def download_pdf(url, filename, deadline=None):
+    """
+    Stream a PDF file to disk in chunks.
+
+    Already downloaded and checksum-verified files are skipped, and an interrupted
+    `.part` file is resumed with a Range request. A transfer still running when `deadline`
+    expires is interrupted, leaving its `.part` file to resume.
+    """
+    if is_downloaded(filename):
+        logger.info(f"Already downloaded: {filename}")
+        tracer.record('download', 0.0, skipped=1)
+        return
+
+    part_path = f"{filename}.part"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+    span_start = time.perf_counter()
+    received = 0
+    timeout = urllib3.Timeout(connect=HTTP_CONNECT_TIMEOUT, read=HTTP_READ_TIMEOUT)
+    if deadline is not None:
+        if deadline.expired():
+            raise TimeoutError("Out of time before the download started")
+        timeout = urllib3.Timeout(connect=deadline.timeout(HTTP_CONNECT_TIMEOUT), read=deadline.timeout(HTTP_READ_TIMEOUT))
+
+    response = http.request("GET", url, headers=headers, preload_content=False, timeout=timeout)
+    try:
+        if response.status == 416:
+            # The partial file is unusable (e.g. the PDF changed); start over
+            os.remove(part_path)
+            response.drain_conn()
+            return download_pdf(url, filename, deadline)
+
+        if response.status == 206:
+            digest = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                for block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                    digest.update(block)
+            mode = 'ab'
+            logger.info(f"Resuming {filename} at byte {offset}")
+        elif response.status == 200:
+            digest = hashlib.sha256()
+            mode = 'wb'
+        else:
+            raise Exception(f"Failed to download PDF: Status code {response.status}")
+
+        with open(part_path, mode) as f:
+            for block in response.stream(DOWNLOAD_CHUNK_SIZE):
+                f.write(block)
+                digest.update(block)
+                received += len(block)
+                if deadline is not None and deadline.expired():
+                    # Don't hand a connection with unread data back to the pool
+                    response.close()
+                    raise TimeoutError(f"Out of time after {offset + received} bytes")
+    finally:
+        response.release_conn()
+        tracer.record('download', time.perf_counter() - span_start, bytes=received, files=1)
+
+    os.replace(part_path, filename)
+    with open(f"{filename}.sha256", 'w') as f:
+        f.write(digest.hexdigest())
+    logger.info(f"Downloaded: {filename}")
 
 
 def extract_text_and_images(pdf_path):
     logger.info(f"Extracting text and images from {pdf_path}...")
-    text_content = ""
-    # images = []
-    with open(pdf_path, 'rb') as f:
-        reader = PyPDF2.PdfReader(f)
-        for page_num, page in enumerate(reader.pages):
-            text_content += page.extract_text() + "\n"
+    result = extract_pdf(pdf_path)
+    record_extraction(result)
     logger.info("Extraction completed.")
 
-    images = extract_images_from_pdf(pdf_path)
+    return result['text'], result['images']
+
 
-    return text_content, images
+def record_extraction(extraction):
+    """Trace an extraction by its own page timings, which also covers extractions done in worker processes."""
+    tracer.record('extract', sum(extraction['page_timings']), pages=len(extraction['page_timings']),
+                  figures=len(extraction['images']), chars=len(extraction['text']))
 
 
-def split_into_chunks(text):
+def split_into_chunks(text, backend=SUMMARY_BACKEND):
     logger.info("Splitting text into chunks...")
-    chapters = re.split(r'\n\s*(\d+\.\s.*)', text)
-    chunks = []
-    for i in range(1, len(chapters), 2):
-        chapter_title = chapters[i].strip()
-        chapter_content = chapters[i+1].strip()
-        chunks.append({'title': chapter_title, 'content': chapter_content})
-
-        print("==========================")
-        print(chapters)
-        print(chapter_title)
-
-    logger.info("Text split into chunks.")
+    # Chunks, with their overlap, must fit one request to the backend
+    target_tokens = min(CHUNK_TARGET_TOKENS, summary_input_tokens(backend) - CHUNK_OVERLAP_TOKENS)
+    with tracer.span('chunk') as span:
+        chunks = chunk_text(text, target_tokens=target_tokens)
+        span.add(chunks=len(chunks), tokens=sum(chunk['tokens'] for chunk in chunks))
+    logger.info(f"Text split into {len(chunks)} chunks ({sum(chunk['tokens'] for chunk in chunks)} tokens).")
     return chunks
 
-def summarize_chunks(chunks):
-    logger.info("Summarizing chunks...")
-    summaries = []
-    for chunk in chunks:
-        prompt = f"""
-This is a chapter of the paper. Please summarize the content from the following aspects:
-1. What was done
-2. The process
-3. What was the result
+def summary_output_tokens(backend=SUMMARY_BACKEND):
+    """Longest reply asked of a summary request to `backend`; small context windows get shorter summaries."""
+    return min(SUMMARY_MAX_TOKENS, get_backend(backend).context_tokens // 4)
+
+def summary_input_tokens(backend=SUMMARY_BACKEND):
+    """Content tokens one summary request to `backend` fits, next to its prompt and reply."""
+    return get_backend(backend).context_tokens - summary_output_tokens(backend) - SUMMARY_PROMPT_TOKENS
+
+def cached_invoke_llm_batch(template, contents, model=LLM_MODEL, timeout=SUMMARY_TIMEOUT, backend=SUMMARY_BACKEND,
+                            deadline=None):
+    """
+    Fill `template` with each of `contents` and send them to the LLM `backend` together (one request
+    if the backend batches), serving repeated requests from the summary cache. The request waits at
+    most `timeout` seconds, cut down to what is left before `deadline`. Failures are returned
+    in-band as "Exception: ..." and never cached.
+    """
+    llm = get_backend(backend)
+    model = llm.model or model
+    keys = [SummaryCache.make_key(template, model, content) for content in contents]
+    summaries = [summary_cache.get(key) for key in keys]
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+    if not missing:
+        return summaries
 
-{chunk['content']}"""
+    if deadline is not None:
+        timeout = deadline.timeout(timeout)
+        if not timeout:
+            return [summary or "Exception: out of time" for summary in summaries]
 
-        summary = invoke_llm(prompt)
+    start = time.perf_counter()
+    try:
+        results = llm.complete_batch([template.format(content=contents[i]) for i in missing],
+                                     model=model, timeout=timeout, max_tokens=summary_output_tokens(backend))
+    except Exception as e:
+        results = [f"Exception: {e}"] * len(missing)
+    elapsed = (time.perf_counter() - start) / len(missing)
+
+    for i, summary in zip(missing, results):
+        summaries[i] = summary
+        if summary and not summary.startswith("Exception:"):
+            summary_cache.set(keys[i], summary, elapsed=elapsed)
+    return summaries
+
+def cached_invoke_llm(template, content, model=LLM_MODEL, timeout=SUMMARY_TIMEOUT, backend=SUMMARY_BACKEND,
+                      deadline=None):
+    """Fill `template` with `content` and call the LLM, serving repeated requests from the summary cache."""
+    return cached_invoke_llm_batch(template, [content], model=model, timeout=timeout, backend=backend,
+                                   deadline=deadline)[0]
+
+def summarize_chunk_batch(chunks, timeout=SUMMARY_TIMEOUT, backend=SUMMARY_BACKEND, deadline=None):
+    summaries = cached_invoke_llm_batch(SUMMARY_PROMPT, [chunk['content'] for chunk in chunks],
+                                        timeout=timeout, backend=backend, deadline=deadline)
+    for chunk, summary in zip(chunks, summaries):
         logger.debug(f"Summary for chunk {chunk['title']}: {summary}")
-        summaries.append({'title': chunk['title'], 'summary': summary})
-    logger.info("Chunks summarized.")
+    return [{'title': chunk['title'], 'summary': summary} for chunk, summary in zip(chunks, summaries)]
+
+def summarize_chunks(chunks, max_workers=SUMMARY_MAX_WORKERS, timeout=SUMMARY_TIMEOUT, backend=SUMMARY_BACKEND,
+                     deadline=None):
+    """
+    Summarize chunks concurrently, at most `max_workers` requests in flight. Backends that batch
+    get up to their `batch_size` chunks per request. Requests still queued when `deadline` expires
+    are not sent. Summaries are returned in the same order as `chunks`.
+    """
+    logger.info("Summarizing chunks...")
+    if not chunks:
+        return []
+
+    batch_size = get_backend(backend).batch_size
+    batches = [chunks[i:i + batch_size] for i in range(0, len(chunks), batch_size)]
+    workers = max(1, min(max_workers, len(batches)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda batch: summarize_chunk_batch(batch, timeout, backend, deadline), batches)
+        summaries = [summary for result in results for summary in result]
+    logger.info(f"Chunks summarized. Summary cache: {summary_cache.stats()}")
     return summaries
 
+def group_by_tokens(parts, budget):
+    """Join consecutive `parts` into as few texts of at most `budget` tokens as possible."""
+    groups, current, size = [], [], 0
+    for part in parts:
+        tokens = count_tokens(part) + 1
+        if current and size + tokens > budget:
+            groups.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(part)
+        size += tokens
+    groups.append("\n\n".join(current))
+    return groups
+
+def reduce_summaries(summaries, max_workers=SUMMARY_MAX_WORKERS, timeout=SUMMARY_TIMEOUT, backend=SUMMARY_BACKEND,
+                     deadline=None):
+    """
+    Combine section summaries into one with REDUCE_PROMPT. When they don't fit one request to `backend`,
+    groups that do are combined first (concurrently), then their results, and so on. Returns the
+    summary, or the "Exception: ..." of the first request that failed.
+    """
+    budget = summary_input_tokens(backend)
+    # Any two parts fit one request, so every round at least halves their number
+    part_tokens = budget // 2 - 1
+    parts = [truncate_tokens(f"{s['title']}:\n{s['summary']}", part_tokens) for s in summaries]
+    while True:
+        groups = group_by_tokens(parts, budget)
+        if len(groups) == 1:
+            return cached_invoke_llm(REDUCE_PROMPT, groups[0], timeout=timeout, backend=backend, deadline=deadline)
+
+        logger.info(f"{len(parts)} summaries don't fit one request, combining them in {len(groups)} groups first")
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(groups)))) as executor:
+            partials = list(executor.map(
+                lambda group: cached_invoke_llm(REDUCE_PROMPT, group, timeout=timeout, backend=backend,
+                                                deadline=deadline),
+                groups))
+        failed = [partial for partial in partials if (partial or "").startswith("Exception:")]
+        if failed:
+            return failed[0]
+        parts = [truncate_tokens(f"Part {i}:\n{partial}", part_tokens) for i, partial in enumerate(partials, 1)]
+
+def choose_summary_strategy(text, abstract=""):
+    if SUMMARY_STRATEGY != 'auto':
+        return SUMMARY_STRATEGY
+    if not text.strip():
+        return 'abstract' if abstract else 'map_reduce'
+    if count_tokens(text) <= min(WHOLE_PAPER_MAX_TOKENS, summary_input_tokens()):
+        return 'whole'
+    return 'map_reduce'
+
+def summarize_paper(text, abstract="", strategy=None, timeout=SUMMARY_TIMEOUT, deadline=None):
+    """
+    Summarize one paper with the cheapest strategy that fits it:
+
+    - 'abstract': a single cheap-model call on the abstract
+    - 'whole': a single call on the full text, when it fits the summary backend's context window
+    - 'map_reduce': parallel per-chunk summaries, combined by a reduce call (in rounds if they don't fit one)
+
+    Every request waits at most `timeout` seconds, and none outlasts `deadline`.
+    Returns a list of {'title', 'summary'} sections for the report.
+    """
+    strategy = strategy or choose_summary_strategy(text, abstract)
+    logger.info(f"Summarizing paper with strategy '{strategy}'...")
+
+    with tracer.span('summarize', papers=1, **{strategy: 1}):
+        return _summarize_paper(text, abstract, strategy, timeout, deadline)
+
+def _summarize_paper(text, abstract, strategy, timeout, deadline):
+    if strategy == 'abstract':
+        summary = cached_invoke_llm(ABSTRACT_PROMPT, abstract, model=LLM_CHEAP_MODEL, timeout=timeout,
+                                    deadline=deadline)
+        return [{'title': 'Abstract', 'summary': summary}]
+
+    if strategy == 'whole':
+        summary = cached_invoke_llm(PAPER_PROMPT, text, timeout=timeout, deadline=deadline)
+        return [{'title': 'Summary', 'summary': summary}]
+
+    summaries = summarize_chunks(split_into_chunks(text), timeout=timeout, deadline=deadline)
+    if len(summaries) <= 1:
+        return summaries
+
+    overview = reduce_summaries(summaries, timeout=timeout, deadline=deadline)
+    return [{'title': 'Overview', 'summary': overview}] + summaries
+
+@tracer.traced('render')
 def construct_report(paper_summaries):
     logger.info("Constructing HTML report with images...")
     html_content = "<html><body>"
@@ -178,43 +691,92 @@ def construct_report(paper_summaries):
             s = chapter['summary'].replace('\n', '<br>')
             html_content += f"<p>{s}</p>"
 
-        # Add images (modify this if you have specific images per section)
-        html_content += '<img src="cid:image0" alt="Image 0"><br>'
+        # Figures attached to the email as inline parts, see prepare_figures
+        for cid in paper.get('figure_cids', []):
+            html_content += f'<img src="cid:{cid}" alt="{cid}"><br>'
 
     html_content += "</body></html>"
     logger.info("Report construction with images completed.")
     return html_content
 
-from email.mime.image import MIMEImage
+def prepare_figures(paper_summaries, max_total_bytes=EMAIL_IMAGES_MAX_BYTES):
+    """
+    Thumbnail the figures of every paper in parallel and assign them Content-IDs.
 
-def send_email(subject, html_content, to_addr, images=[], ics_path=None):
-    logger.info("Sending email...")
+    Sets `figure_cids` on each paper for `construct_report` and returns the inline attachments
+    for `send_email`. Figures beyond `max_total_bytes` are dropped, so the email stays bounded.
+    """
+    logger.info("Preparing figures...")
+    figures = [(paper, figure) for paper in paper_summaries for figure in paper.get('figures', [])]
+    with tracer.span('thumbnail', figures=len(figures)) as span:
+        thumbnails = make_thumbnails([figure['image'] for _, figure in figures])
+        span.add(bytes=sum(len(thumbnail) for thumbnail in thumbnails if thumbnail is not None))
+
+    subtype = 'webp' if THUMBNAIL_FORMAT == 'WEBP' else 'jpeg'
+    attachments = []
+    total_bytes = 0
+    for paper in paper_summaries:
+        paper['figure_cids'] = []
+    for (paper, figure), thumbnail in zip(figures, thumbnails):
+        if thumbnail is None or total_bytes + len(thumbnail) > max_total_bytes:
+            continue
+        total_bytes += len(thumbnail)
+
+        cid = f"figure{len(attachments)}"
+        paper['figure_cids'].append(cid)
+        attachments.append({'cid': cid, 'image': thumbnail, 'subtype': subtype})
+
+    logger.info(f"Prepared {len(attachments)} of {len(figures)} figures ({total_bytes} bytes).")
+    return attachments
+
+
+def read_attachment(path):
+    """Read an attachment once, as (filename, bytes), to be reused for every message."""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return os.path.basename(path), f.read()
+
+def build_email(subject, html_content, to_addr, images=[], attachment=None):
+    """
+    `images` are inline attachments as returned by `prepare_figures`, referenced from the
+    HTML through their Content-ID. `attachment` is a (filename, bytes) pair, see `read_attachment`.
+    """
     message = MIMEMultipart()
     message['From'] = EMAIL_ADDRESS
     message['To'] = to_addr
     message['Subject'] = subject
 
-    message.attach(MIMEText(html_content, 'html'))
-
-    # for i, image_content in enumerate(images):
-    #     mime_image = MIMEImage(image_content, _subtype='png')
-    #     mime_image.add_header('Content-ID', f'<image{i}>')
-    #     mime_image.add_header('Content-Disposition', 'inline', filename=f'image{i}.png')
-    #     message.attach(mime_image)
-
-     # Attach the ICS file if available
-    if ics_path and os.path.exists(ics_path):
-        with open(ics_path, 'rb') as f:
-            mime_ics = MIMEBase('application', 'octet-stream')
-            mime_ics.set_payload(f.read())
-            encoders.encode_base64(mime_ics)
-            mime_ics.add_header('Content-Disposition', 'attachment', filename=os.path.basename(ics_path))
-            message.attach(mime_ics)
-
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-        server.starttls()
-        server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-        server.send_message(message)
+    # The HTML body and the images it references belong together in a multipart/related part
+    body = MIMEMultipart('related')
+    body.attach(MIMEText(html_content, 'html'))
+    for image in images:
+        mime_image = MIMEImage(image['image'], _subtype=image['subtype'])
+        mime_image.add_header('Content-ID', f"<{image['cid']}>")
+        mime_image.add_header('Content-Disposition', 'inline', filename=f"{image['cid']}.{image['subtype']}")
+        body.attach(mime_image)
+    message.attach(body)
+
+    if attachment is not None:
+        filename, payload = attachment
+        mime_attachment = MIMEBase('application', 'octet-stream')
+        mime_attachment.set_payload(payload)
+        encoders.encode_base64(mime_attachment)
+        mime_attachment.add_header('Content-Disposition', 'attachment', filename=filename)
+        message.attach(mime_attachment)
+
+    return message
+
+def create_mailer():
+    return SMTPMailer(SMTP_SERVER, SMTP_PORT, EMAIL_ADDRESS, EMAIL_PASSWORD,
+                      max_retries=SMTP_MAX_RETRIES, backoff=SMTP_RETRY_BACKOFF)
+
+def send_email(subject, html_content, to_addr, images=[], ics_path=None):
+    logger.info("Sending email...")
+    message = build_email(subject, html_content, to_addr, images, read_attachment(ics_path))
+
+    with create_mailer() as mailer:
+        mailer.send(message)
     logger.info("Email sent successfully.")
 
 def delete_papers():
@@ -229,65 +791,700 @@ def delete_papers():
             except Exception as e:
                 logger.error(f"Failed to delete {file_path}. Reason: {e}")
 
-def run():
+def load_subscriptions():
+    """
+    Subscriptions map arXiv topics to recipients. They are read from SUBSCRIPTIONS_FILE or the
+    SUBSCRIPTIONS env var, as JSON:
+
+        [{"topics": ["cs.AI", "cs.LG"], "recipients": ["a@example.com"], "interest_profile": "agents"}]
+
+    `interest_profile` is optional and defaults to INTEREST_PROFILE. Without any configuration
+    this is a single PAPER_TOPIC -> TARGET_ADDRESS subscription.
+    """
+    raw = SUBSCRIPTIONS
+    if SUBSCRIPTIONS_FILE and os.path.exists(SUBSCRIPTIONS_FILE):
+        with open(SUBSCRIPTIONS_FILE, 'r', encoding='utf-8') as f:
+            raw = f.read()
+
+    if raw:
+        return json.loads(raw)
+    return [{'topics': [PAPER_TOPIC], 'recipients': [TARGET_ADDRESS]}]
+
+
+def fetch_topic_entries(topic, ranked=False, deadline=None, progress=None):
+    """
+    New entries of `topic`. A `ranked` topic gets every unseen entry, since ranking picks the
+    ones to process; otherwise at most ARXIV_MAX_PAPERS. None if `deadline` interrupted the
+    fetch, see `fetch_new_papers`.
+    """
+    with tracer.span('fetch', topics=1) as span:
+        entries = _fetch_topic_entries(topic, ranked, deadline, progress)
+        span.add(entries=len(entries or []))
+    return entries
+
+
+def _fetch_topic_entries(topic, ranked, deadline, progress):
+    if ARXIV_FETCH_MODE == 'incremental':
+        return fetch_new_papers(topic, max_papers=None if ranked else ARXIV_MAX_PAPERS,
+                                deadline=deadline, progress=progress)
+
+    feed = fetch_today_papers(topic)
+    try:
+        return list(iter_entries(feed))
+    finally:
+        feed.drain_conn()
+        feed.release_conn()
+
+
+def merge_entries(entries_by_topic):
+    """Dedupe entries fetched for several topics by arXiv id, recording every topic each came from."""
+    unique = {}
+    for topic, entries in entries_by_topic.items():
+        for entry in entries:
+            if entry['id'] not in unique:
+                unique[entry['id']] = dict(entry, topics=[])
+            unique[entry['id']]['topics'].append(topic)
+    return unique
+
+
+def interest_profile(subscription):
+    return subscription.get('interest_profile', INTEREST_PROFILE)
+
+
+def ranked_topics(subscriptions):
+    """Topics whose every subscription has an interest profile, so ranking alone bounds what is processed."""
+    topics = {}
+    for subscription in subscriptions:
+        for topic in subscription['topics']:
+            topics[topic] = topics.get(topic, True) and bool(interest_profile(subscription).strip())
+    return {topic for topic, ranked in topics.items() if ranked}
+
+
+def select_papers(subscription, unique):
+    """Ids of the papers for one subscription: its topics' papers, filtered by its interest profile."""
+    topics = set(subscription['topics'])
+    candidates = [entry for entry in unique.values() if topics & set(entry['topics'])]
+    return [entry['id'] for entry in rank_papers(candidates, interest_profile(subscription))]
+
+
+def find_original(paper, kind, signature):
+    """
+    An archived, summarized paper that `paper` is a version of, or a near-duplicate of by its `kind`
+    signature, as (stored paper, similarity); None if there is none.
+    """
+    candidates = [(paper_id, 1.0) for paper_id in paper_store.get_versions(paper['id'])]
+    if signature is not None:
+        candidates += paper_store.find_near_duplicates(kind, signature, DEDUP_THRESHOLD)
+
+    for paper_id, similarity in candidates:
+        original = paper_store.get(paper_id)
+        if original is not None and original['summaries']:
+            return original, similarity
+    return None
+
+
+def reuse_summary(paper, original):
+    """Summarize `paper` with the summaries of `original`, plus what changed if the abstracts differ."""
+    text_path = job_file(paper['id'], '.txt')
+    if not os.path.exists(text_path):
+        with open(text_path, 'w', encoding='utf-8') as f:
+            f.write(original.get('text') or "")
+    paper.setdefault('figure_files', [])
+
+    summaries = [s for s in original['summaries'] if not s['title'].startswith("Changes since ")]
+    if paper.get('abstract') and original.get('abstract') and paper['abstract'] != original['abstract']:
+        changes = cached_invoke_llm(CHANGES_PROMPT, f"{original['abstract']}\n----\n{paper['abstract']}",
+                                    model=LLM_CHEAP_MODEL)
+        if not changes.startswith("Exception:"):
+            summaries = [{'title': f"Changes since {original['id']}", 'summary': changes}] + summaries
+
+    paper['summaries'] = summaries
+    paper['duplicate_of'] = original['id']
+    paper['status'] = 'summarized'
+
+
+def reuse_if_duplicate(paper, kind, text):
+    """
+    Record the MinHash signature of `text` on `paper` and, if an archived paper is the same work,
+    reuse its summary. Returns True if the paper needs no summarizing of its own.
+    """
+    with tracer.span('dedup', papers=1) as span:
+        signature = minhash(text)
+        paper.setdefault('signatures', {})[kind] = signature
+        found = find_original(paper, kind, signature)
+        if found is None:
+            return False
+
+        original, similarity = found
+        logger.info(f"Paper {paper['id']} is a near-duplicate of {original['id']} ({kind} similarity "
+                    f"{similarity:.2f}), reusing its summary")
+        reuse_summary(paper, original)
+        span.add(duplicates=1)
+        return True
+
+
+def store_paper(paper):
+    """Archive a summarized paper, so later versions and near-duplicates can reuse its summary."""
+    paper_store.add_papers([load_paper(paper)])
+
+
+class Deadline:
+    """Time budget of one invocation; `None` means unlimited."""
+
+    def __init__(self, budget=None):
+        self.end = time.monotonic() + budget if budget else None
+
+    def remaining(self):
+        return float('inf') if self.end is None else self.end - time.monotonic()
+
+    def expired(self, reserve=0.0):
+        return self.remaining() <= reserve
+
+    def timeout(self, limit):
+        """`limit` seconds, cut down to what is left of the budget."""
+        return max(0.0, min(limit, self.remaining()))
+
+    def before(self, reserve):
+        """A deadline `reserve` seconds earlier, e.g. to leave time for checkpointing after a step."""
+        deadline = Deadline()
+        deadline.end = None if self.end is None else self.end - reserve
+        return deadline
+
+
+def job_file(paper_id, suffix):
+    safe_id = re.sub(r'[^\w.-]', '_', paper_id)
+    return os.path.join(JOB_DIR, f"{safe_id}{suffix}")
+
+
+def new_job_id():
+    return uuid.uuid4().hex[:12]
+
+
+def save_job(job):
+    job['updated_at'] = time.time()
+    state_store.set('job', job)
+
+
+@contextlib.contextmanager
+def stage_timer(job, stage):
+    """Add the wall time spent in the block to the job's timing of `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = job.setdefault('timings', {})
+        timings[stage] = round(timings.get(stage, 0.0) + time.perf_counter() - start, 3)
+
+
+def fail_paper(paper, reason):
+    """Count a failed attempt; after JOB_MAX_ATTEMPTS the paper is given up on."""
+    paper['attempts'] = paper.get('attempts', 0) + 1
+    logger.error(f"Attempt {paper['attempts']} on paper {paper['title']} failed: {reason}")
+    if paper['attempts'] >= JOB_MAX_ATTEMPTS:
+        paper['status'] = 'failed'
+
+
+def start_job(job_id=None):
+    """Create and persist a new job; its first stage fetches the papers, see `fetch_stage`."""
+    job = {
+        'job_id': job_id or new_job_id(),
+        'created_at': time.time(),
+        'state': 'running',
+        'stage': 'fetching',
+        'timings': {},
+        'subscriptions': load_subscriptions(),
+        # Per topic: the pages fetched so far, see fetch_new_papers
+        'fetch_progress': {},
+        'papers': {},
+        'mailed': [],
+    }
+    save_job(job)
+    return job
+
+
+def fetch_stage(job, deadline):
+    """
+    Fetch every topic once, dedupe and select papers. The fetch progress of every topic is kept
+    in the job, so an interrupted fetch continues where it stopped. Returns False if the deadline
+    interrupted the stage.
+    """
+    subscriptions = job['subscriptions']
+    if 'selections' not in job:
+        topics = list(dict.fromkeys(topic for subscription in subscriptions for topic in subscription['topics']))
+
+        # Each category is fetched once, however many subscriptions include it. Topics that are only
+        # ranked are fetched in full, so the top papers are picked from the whole day, not its first few
+        ranked = ranked_topics(subscriptions)
+        fetched = False
+        for topic in topics:
+            progress = job['fetch_progress'].setdefault(topic, {})
+            if progress.get('done'):
+                continue
+            if deadline.expired(JOB_STEP_RESERVE):
+                save_job(job)
+                return False
+            if fetched:
+                time.sleep(ARXIV_PAGE_DELAY)
+            fetched = True
+
+            entries = fetch_topic_entries(topic, ranked=topic in ranked, deadline=deadline, progress=progress)
+            if entries is None:
+                save_job(job)
+                return False
+            job['fetch_progress'][topic] = {'done': True, 'entries': entries}
+            save_job(job)
+
+        entries_by_topic = {topic: job['fetch_progress'][topic]['entries'] for topic in topics}
+        unique = merge_entries(entries_by_topic)
+        if not unique:
+            logger.info("No new papers since the last run.")
+
+        # Only the papers most relevant to some subscription are downloaded and summarized, each once
+        selections = [select_papers(subscription, unique) for subscription in subscriptions]
+        selected = set(paper_id for selection in selections for paper_id in selection)
+        logger.info(f"Selected {len(selected)} of {len(unique)} unique papers for {len(subscriptions)} subscriptions.")
+
+        job['selections'] = selections
+        # What commit_high_water_mark needs once the job is done
+        job['fetched'] = {topic: [{'id': e['id'], 'published': e['published']} for e in entries]
+                          for topic, entries in entries_by_topic.items()}
+        job['papers'] = {paper_id: dict(entry, status='fetched', attempts=0)
+                         for paper_id, entry in unique.items() if paper_id in selected}
+        del job['fetch_progress']
+        save_job(job)
+    os.makedirs(JOB_DIR, exist_ok=True)
+
+    # New versions, cross-lists and near-identical preprints of archived papers skip straight to mailing
+    for paper in job['papers'].values():
+        if 'abstract' in paper.get('signatures', {}):
+            continue
+        if deadline.expired(JOB_STEP_RESERVE):
+            save_job(job)
+            return False
+        if reuse_if_duplicate(paper, 'abstract', paper.get('abstract') or ""):
+            store_paper(paper)
+
+    job['stage'] = 'fetched'
+    save_job(job)
+    return True
+
+
+def download_stage(job, deadline):
+    """
+    Download every fetched paper, one batch of PDF_DOWNLOAD_WORKERS at a time, checkpointing after
+    each. Returns False if the deadline interrupted the stage.
+    """
+    # Transfers stop early enough to checkpoint; interrupted ones resume from their .part file
+    download_deadline = deadline.before(JOB_STEP_RESERVE / 2)
+    while True:
+        pending = [paper for paper in job['papers'].values() if paper['status'] == 'fetched']
+        if not pending:
+            return True
+        if deadline.expired(JOB_STEP_RESERVE):
+            return False
+
+        batch = pending[:PDF_DOWNLOAD_WORKERS]
+        downloaded = {paper['id']: paper for paper in download_papers(batch, deadline=download_deadline)}
+        for paper in batch:
+            if paper['id'] in downloaded:
+                paper['filename'] = downloaded[paper['id']]['filename']
+                paper['status'] = 'downloaded'
+            elif not download_deadline.expired():
+                fail_paper(paper, "download failed")
+        save_job(job)
+
+
+def save_extraction(paper, extraction):
+    with open(job_file(paper['id'], '.txt'), 'w', encoding='utf-8') as f:
+        f.write(extraction['text'])
+
+    paper['figure_files'] = []
+    for i, figure in enumerate(extraction['images']):
+        path = job_file(paper['id'], f".fig{i}.{figure['ext']}")
+        with open(path, 'wb') as f:
+            f.write(figure['image'])
+        metadata = {key: value for key, value in figure.items() if key != 'image'}
+        paper['figure_files'].append(dict(metadata, path=path))
+
+
+def load_paper(paper):
+    """The job's paper record with its extracted text and figures loaded back from disk."""
+    with open(job_file(paper['id'], '.txt'), 'r', encoding='utf-8') as f:
+        text = f.read()
+
+    figures = []
+    for figure in paper.get('figure_files', []):
+        with open(figure['path'], 'rb') as f:
+            figures.append(dict(figure, image=f.read()))
+    return dict(paper, text=text, figures=figures)
+
+
+def has_job_files(paper):
+    """Whether this instance has the files the paper's status needs: its PDF, or its extracted text and figures."""
+    if paper['status'] == 'downloaded':
+        return os.path.exists(paper['filename'])
+    return (os.path.exists(job_file(paper['id'], '.txt'))
+            and all(os.path.exists(figure['path']) for figure in paper.get('figure_files', [])))
+
+
+def restore_job_files(job):
+    """
+    Send the papers whose files are missing (the job paused on another function instance, whose
+    /tmp this one can't see) back to downloading. Summaries already made are kept, see summarize_stage.
+    Only papers of digests still to be mailed are restored. Returns the number of papers sent back.
+    """
+    needed = set(paper_id for index, selection in enumerate(job.get('selections', []))
+                 if index not in job['mailed'] for paper_id in selection)
+    lost = [paper for paper_id, paper in job['papers'].items()
+            if paper_id in needed and paper['status'] in ('downloaded', 'extracted', 'summarized')
+            and not has_job_files(paper)]
+    for paper in lost:
+        paper['status'] = 'fetched'
+    if lost:
+        os.makedirs(JOB_DIR, exist_ok=True)
+        job['stage'] = 'fetched'
+        save_job(job)
+    return len(lost)
+
+
+def summarize_stage(job, deadline):
+    """
+    Extract and summarize the downloaded papers, checkpointing after every step. PDFs of the
+    following papers are parsed in worker processes while one is being summarized. Summarized
+    papers are archived right away; a paper whose text matches an archived one reuses its summary,
+    and one that was summarized before its files were lost (see restore_job_files) keeps its own.
+    Returns False if the deadline interrupted the stage.
+    """
+    while True:
+        pending = [paper for paper in job['papers'].values() if paper['status'] in ('downloaded', 'extracted')]
+        if not pending:
+            job['stage'] = 'summarized'
+            save_job(job)
+            return True
+
+        to_extract = [paper for paper in pending if paper['status'] == 'downloaded']
+        extractions = iter_extract_pdfs([paper['filename'] for paper in to_extract])
+        try:
+            for paper in pending:
+                if deadline.expired(JOB_STEP_RESERVE):
+                    return False
+
+                if paper['status'] == 'downloaded':
+                    logger.info(f"Extracting paper: {paper['title']}")
+                    try:
+                        extraction = next(extractions)
+                    except Exception as e:
+                        # The extraction pipeline is gone; retry the rest on the next pass
+                        fail_paper(paper, e)
+                        save_job(job)
+                        break
+                    record_extraction(extraction)
+                    save_extraction(paper, extraction)
+                    paper['status'] = 'extracted'
+                    if not any(p['status'] == 'downloaded' for p in job['papers'].values()):
+                        job['stage'] = 'extracted'
+                    save_job(job)
+
+                    if deadline.expired(JOB_STEP_RESERVE):
+                        return False
+
+                if paper.get('summaries'):
+                    paper['status'] = 'summarized'
+                    store_paper(paper)
+                    save_job(job)
+                    continue
+
+                loaded = load_paper(paper)
+                if reuse_if_duplicate(paper, 'text', loaded['text']):
+                    store_paper(paper)
+                    save_job(job)
+                    continue
+
+                logger.info(f"Summarizing paper: {paper['title']}")
+                summaries = summarize_paper(loaded['text'], paper.get('abstract', ""),
+                                            deadline=deadline.before(JOB_STEP_RESERVE / 2))
+                if any((s['summary'] or "").startswith("Exception:") for s in summaries):
+                    # Completed chunk summaries are in the summary cache, so a retry only redoes the rest
+                    fail_paper(paper, "summarization failed")
+                else:
+                    paper['summaries'] = summaries
+                    paper['status'] = 'summarized'
+                    store_paper(paper)
+                save_job(job)
+        finally:
+            extractions.close()
+
+
+def mail_stage(job, deadline):
+    """
+    Send one digest per subscription. Recipients a digest could not be sent to are retried on the
+    next run, up to JOB_MAX_ATTEMPTS sends, before they are given up on and listed in the status.
+    Returns False if the deadline interrupted the stage or a digest is left to retry.
+    """
+    delivered = job.setdefault('delivered', {})
+    attempts = job.setdefault('mail_attempts', {})
+    # One SMTP session is shared by every digest of the run
+    with create_mailer() as mailer:
+        for index, (subscription, selection) in enumerate(zip(job['subscriptions'], job['selections'])):
+            if index in job['mailed']:
+                continue
+            if deadline.expired(JOB_STEP_RESERVE):
+                return False
+
+            papers = [load_paper(job['papers'][paper_id]) for paper_id in selection
+                      if paper_id in job['papers'] and job['papers'][paper_id]['status'] == 'summarized']
+            if papers:
+                # JSON keys are strings
+                done = delivered.setdefault(str(index), [])
+                pending = [recipient for recipient in subscription['recipients'] if recipient not in done]
+                failed = send_digest(subscription, papers, mailer, recipients=pending)
+                done += [recipient for recipient in pending if recipient not in failed]
+
+                if failed:
+                    attempts[str(index)] = attempts.get(str(index), 0) + 1
+                    if attempts[str(index)] < JOB_MAX_ATTEMPTS:
+                        logger.error(f"Attempt {attempts[str(index)]} at the digest for {', '.join(failed)} failed, "
+                                     f"retrying on the next run")
+                        save_job(job)
+                        continue
+                    logger.error(f"Giving up on the digest for {', '.join(failed)}")
+                    job.setdefault('undelivered', []).extend(failed)
+
+            job['mailed'].append(index)
+            save_job(job)
+
+    if len(job['mailed']) < len(job['subscriptions']):
+        return False
+    job['stage'] = 'mailed'
+    save_job(job)
+    return True
+
+
+def finish_job(job):
+    delete_papers()
+    shutil.rmtree(JOB_DIR, ignore_errors=True)
+
+    if ARXIV_FETCH_MODE == 'incremental':
+        for topic, entries in job['fetched'].items():
+            commit_high_water_mark(topic, entries)
+    state_store.delete('job')
+
+
+def job_status(job):
+    counts = {}
+    for paper in job['papers'].values():
+        counts[paper['status']] = counts.get(paper['status'], 0) + 1
+    return {
+        'job_id': job['job_id'],
+        'state': job['state'],
+        'stage': job['stage'],
+        'done': job['state'] == 'done',
+        'papers': counts,
+        'timings': job.get('timings', {}),
+        'error': job.get('error'),
+        'undelivered': job.get('undelivered', []),
+        'created_at': job.get('created_at'),
+        'updated_at': job.get('updated_at'),
+    }
+
+
+def empty_job_status(job_id, state, stage=None, error=None):
+    """Status of a job that never got as far as selecting papers."""
+    now = time.time()
+    return {'job_id': job_id or new_job_id(), 'state': state, 'stage': stage, 'done': state == 'done',
+            'papers': {}, 'timings': {}, 'error': error, 'created_at': now, 'updated_at': now}
+
+
+def record_job_status(status):
+    """Remember the status of the latest JOB_HISTORY_SIZE jobs for the status endpoint."""
+    try:
+        history = status_store.get('jobs', {})
+        history[status['job_id']] = status
+        latest = sorted(history.values(), key=lambda s: s.get('updated_at') or 0, reverse=True)[:JOB_HISTORY_SIZE]
+        status_store.set('jobs', {s['job_id']: s for s in latest})
+    except Exception as e:
+        # The job itself must not fail because its status could not be published
+        logger.error(f"Failed to record the status of job {status['job_id']}: {e}")
+
+
+def get_job_status(job_id=None):
+    """
+    Status of `job_id` (the most recent job if None), or None if it is unknown. The unfinished job is
+    reported as of its latest checkpoint; others as of the end of their latest run.
+    """
+    job = state_store.get('job')
+    if job is not None and job_id in (None, job['job_id']):
+        return job_status(job)
+
+    history = status_store.get('jobs', {})
+    if job_id is None:
+        return max(history.values(), key=lambda s: s.get('updated_at') or 0, default=None)
+    return history.get(job_id)
+
+
+def send_digest(subscription, papers, mailer, recipients=None):
+    """
+    Build one report from `papers` and send it through `mailer` to `recipients` (every recipient
+    of `subscription` if None). Returns the recipients it could not be sent to.
+    """
+    # prepare_figures annotates the papers; copy them so digests sharing a paper don't clash
+    digest = [dict(paper) for paper in papers]
+
+    # Estimate reading time
+    reading_time_minutes = estimate_reading_time("".join(paper['text'] for paper in digest))
+    start_time = datetime.now()
+    end_time = start_time + timedelta(minutes=reading_time_minutes)
+
+    # Create ICS file with estimated reading time
+    ics_file_name = "reading_schedule.ics"
+    create_ics_file(
+            event_name="arXiv Paper Reading",
+            start_time=start_time,
+            end_time=end_time,
+            description="Scheduled time for reading today's arXiv papers.",
+            location="Anywhere",
+            file_name=ics_file_name
+    )
+
+    figures = prepare_figures(digest)
+    report = construct_report(digest)
+    ics = read_attachment(ics_file_name)
+    messages = [
+        build_email("Daily arXiv Paper News 🚀", report, recipient, images=figures, attachment=ics)
+        for recipient in (subscription['recipients'] if recipients is None else recipients)
+    ]
+    with tracer.span('send', messages=len(messages)) as span:
+        failures = mailer.send_batch(messages)
+        span.add(failures=len(failures))
+    return [message['To'] for message, _ in failures]
+
+
+def write_run_report(status):
+    """
+    Write this invocation's latency trace, next to the job status it ended with, to TRACE_DIR
+    (and TRACE_PROMETHEUS_PATH if set). Returns the path of the JSON report.
+    """
+    path = os.path.join(TRACE_DIR, f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{status['job_id']}.json")
+    try:
+        tracer.write_json(path, job=status, summary_cache=summary_cache.stats())
+        if TRACE_PROMETHEUS_PATH:
+            tracer.write_prometheus(TRACE_PROMETHEUS_PATH)
+    except OSError as e:
+        logger.error(f"Failed to write run report: {e}")
+        return None
+    logger.info(f"Run report written to {path}")
+    return path
+
+
+def run(time_budget=None, job_id=None):
+    """
+    Run the pipeline as a checkpointed job: fetching -> fetched -> downloaded -> extracted -> summarized -> mailed.
+
+    Progress is persisted after every step. With a `time_budget` (seconds), the job stops cleanly
+    before it runs out, and the next call resumes from the last completed step. `job_id` names a
+    new job; it is ignored when an unfinished job is resumed. Returns the job status.
+
+    Every call also writes a latency report of its stages, see `write_run_report`.
+    """
+    tracer.reset()
+    status = _run(time_budget, job_id)
+    status['report'] = write_run_report(status)
+    return status
+
+
+def _run(time_budget, job_id):
     logger.info("Job started")
+    deadline = Deadline(time_budget)
+
+    job = state_store.get('job')
     try:
-        xml_data = fetch_today_papers()
-        papers = parse_and_download_papers(xml_data)
-
-        all_images = []
-        total_text_content = ""
-
-        paper_summaries = []
-        for paper in papers:
-            logger.info(f"Processing paper: {paper['title']}")
-            text_content, images = extract_text_and_images(paper['filename'])
-            total_text_content += text_content
-
-            all_images.extend(images)
-
-            chunks = split_into_chunks(text_content)
-
-            # print("================================")
-            # for chunk in chunks:
-            #     print("================================")
-            #     print(f"Chunk: {chunk['content']}")
-
-            summaries = summarize_chunks(chunks)
-            # print(summaries)
-
-            paper_summaries.append({
-                    'title': paper['title'],
-                    'summaries': summaries
-                })
-
-        # Estimate reading time
-        reading_time_minutes = estimate_reading_time(total_text_content)
-        start_time = datetime.now()
-        end_time = start_time + timedelta(minutes=reading_time_minutes)
-
-        # Create ICS file with estimated reading time
-        ics_file_name = "reading_schedule.ics"
-        create_ics_file(
-                event_name="arXiv Paper Reading",
-                start_time=start_time,
-                end_time=end_time,
-                description="Scheduled time for reading today's arXiv papers.",
-                location="Anywhere",
-                file_name=ics_file_name
-        )
-
-        report = construct_report(paper_summaries)
-        send_email(
-            "Daily arXiv Paper News 🚀",
-            report,
-            TARGET_ADDRESS,
-            images=[image_content for image_content in all_images],
-            ics_path=ics_file_name)
-        delete_papers()
+        if job is None:
+            job = start_job(job_id)
+        else:
+            logger.info(f"Resuming job {job['job_id']} after stage '{job['stage']}'")
+            restored = restore_job_files(job)
+            if restored:
+                logger.info(f"Files of {restored} papers are not on this instance, downloading them again")
+        job['state'] = 'running'
+        job['error'] = None
+        save_job(job)
+        record_job_status(job_status(job))
+
+        if job['stage'] == 'fetching':
+            with stage_timer(job, 'fetched'):
+                finished = fetch_stage(job, deadline)
+            if not finished:
+                return pause_job(job)
+
+        if job['stage'] == 'fetched':
+            with stage_timer(job, 'downloaded'):
+                finished = download_stage(job, deadline)
+            if not finished:
+                return pause_job(job)
+            job['stage'] = 'downloaded'
+            save_job(job)
+
+        if job['stage'] in ('downloaded', 'extracted'):
+            with stage_timer(job, 'summarized'):
+                finished = summarize_stage(job, deadline)
+            if not finished:
+                return pause_job(job)
+
+        if job['stage'] == 'summarized':
+            with stage_timer(job, 'mailed'):
+                finished = mail_stage(job, deadline)
+            if not finished:
+                return pause_job(job)
+
+        finish_job(job)
+        job['state'] = 'done'
+        job['updated_at'] = time.time()
+        logger.info(f"Job {job['job_id']} completed")
+        status = job_status(job)
+        record_job_status(status)
+        return status
 
     except Exception as e:
-        logger.error(f"An error occurred during the job: {e}")
+        logger.exception(f"An error occurred during the job: {e}")
+        if job is None:
+            status = empty_job_status(job_id, 'failed', error=str(e))
+            record_job_status(status)
+            return status
+
+        job['state'] = 'failed'
+        job['error'] = str(e)
+        job['failed_runs'] = job.get('failed_runs', 0) + 1
+        if job['failed_runs'] >= JOB_MAX_ATTEMPTS:
+            # An error that repeats would otherwise keep every later job from starting
+            logger.error(f"Job {job['job_id']} failed {job['failed_runs']} runs in a row, giving up on it")
+            abandon_job(job)
+        else:
+            # The job stays in place, so the next run resumes it
+            save_job(job)
+        status = job_status(job)
+        record_job_status(status)
+        return status
+
+
+def abandon_job(job):
+    """
+    Drop a failed job and its files, so the next run starts a new one. The high-water marks are
+    not advanced, so the new job fetches the same papers again.
+    """
+    delete_papers()
+    shutil.rmtree(JOB_DIR, ignore_errors=True)
+    state_store.delete('job')
+    job['updated_at'] = time.time()
+
+
+def pause_job(job):
+    logger.info(f"Job {job['job_id']} paused after stage '{job['stage']}', the next run resumes it")
+    job['state'] = 'paused'
+    job['failed_runs'] = 0
+    save_job(job)
+    status = job_status(job)
+    record_job_status(status)
+    return status
 
 if __name__ == "__main__":
     run()
\ No newline at end of file
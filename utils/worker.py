@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from utils.utils import run, state_store, new_job_id, empty_job_status, record_job_status, JOB_TIME_BUDGET
+
+logger = logging.getLogger(__name__)
+
+# Longest a trigger keeps its serverless function alive for the job it started; the job itself
+# stops after JOB_TIME_BUDGET, this leaves time to finish the step in progress (maxDuration is 60)
+JOB_WAIT_TIMEOUT = float(os.getenv('JOB_WAIT_TIMEOUT', 55))
+
+_lock = threading.Lock()
+_worker = None
+_worker_job_id = None
+
+
+def submit_job(time_budget=JOB_TIME_BUDGET, resume_only=False):
+    """
+    Run the pipeline on a background thread and return the job id without waiting for it.
+
+    An unfinished job is resumed under its own id. If a job is already running in this
+    process, or was checkpointed by another process within JOB_WAIT_TIMEOUT, its id is
+    returned instead of starting another one. With `resume_only`, no new
+    job is started: None is returned if there is no unfinished job.
+    """
+    global _worker, _worker_job_id
+
+    with _lock:
+        if _worker is not None and _worker.is_alive():
+            return _worker_job_id
+
+        job = state_store.get('job')
+        if job is not None:
+            job_id = job['job_id']
+            if job['state'] == 'running' and time.time() - job.get('updated_at', 0) < JOB_WAIT_TIMEOUT:
+                # Another function instance checkpointed it just now, it is still at work
+                logger.info(f"Job {job_id} is running elsewhere")
+                return job_id
+        elif resume_only:
+            return None
+        else:
+            job_id = new_job_id()
+            record_job_status(empty_job_status(job_id, 'queued'))
+
+        _worker = threading.Thread(target=run, kwargs={'time_budget': time_budget, 'job_id': job_id},
+                                   name=f"job-{job_id}", daemon=True)
+        _worker_job_id = job_id
+        _worker.start()
+        logger.info(f"Job {job_id} submitted")
+        return job_id
+
+
+def wait_for_job(timeout=JOB_WAIT_TIMEOUT):
+    """Block until the background job of this process (if any) has finished or `timeout` passed."""
+    worker = _worker
+    if worker is not None:
+        worker.join(timeout)
+    return worker is None or not worker.is_alive()
+
+
+def trigger_job(request, resume_only=False):
+    """
+    Serve a cron trigger on `request` (a BaseHTTPRequestHandler): submit the job, answer with its id
+    and status URL (202; 200 with a null id if `resume_only` found nothing to resume), then keep the
+    request open while the job runs.
+    """
+    job_id = submit_job(resume_only=resume_only)
+
+    if job_id is None:
+        code, payload = 200, {'job_id': None}
+    else:
+        code, payload = 202, {'job_id': job_id, 'status_url': f"/api/status?job_id={job_id}"}
+    body = json.dumps(payload).encode('utf-8')
+    request.send_response(code)
+    request.send_header('Content-type', 'application/json')
+    request.send_header('Content-Length', str(len(body)))
+    request.end_headers()
+    request.wfile.write(body)
+    request.wfile.flush()
+
+    # A serverless function is frozen as soon as its handler returns, so this request stays open
+    # while the job runs its time-budgeted slice; the platform may only deliver the answer then
+    wait_for_job()